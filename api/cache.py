@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+# sentinel so that None can be cached as a value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL.
+
+    Entries can carry tags (e.g. "shop:<id>") so that one write can drop
+    every cached response that depends on it with invalidate_tag().
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _CACHES.append(self)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value or MISSING.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at, tags = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        tags: Iterable[str] = (),
+    ) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires_at, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def invalidate_tag(self, tag: str) -> None:
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+            self._tags.pop(tag, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _drop(self, key: Hashable) -> None:
+        # caller holds the lock
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+_CACHES: List[TTLCache] = []
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {c.name: c.stats() for c in _CACHES}
+
+
+# =============================
+# Shop catalog (items)
+# =============================
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "2048"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+
+# values are ready-to-send JSON bodies (bytes)
+catalog_cache = TTLCache("catalog", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+
+def shop_tag(shop_id: str) -> str:
+    return f"shop:{shop_id}"
+
+
+def item_tag(item_id: str) -> str:
+    return f"item:{item_id}"
+
+
+def invalidate_shop_catalog(shop_id: str) -> None:
+    """
+    Call after any item is created/updated/deleted in the shop.
+    """
+    catalog_cache.invalidate_tag(shop_tag(shop_id))
+
+
+def invalidate_item(item_id: str, shop_id: str) -> None:
+    """
+    Call after an item is updated or deleted.
+    """
+    catalog_cache.invalidate_tag(item_tag(item_id))
+    invalidate_shop_catalog(shop_id)
+
+
+# =============================
+# Referral codes -> shop
+# =============================
+
+REFERRAL_CACHE_SIZE = int(os.getenv("REFERRAL_CACHE_SIZE", "10000"))
+REFERRAL_CACHE_TTL = float(os.getenv("REFERRAL_CACHE_TTL", "300"))
+# "not found" answers are kept shortly, a new shop may take the code
+REFERRAL_NEGATIVE_TTL = float(os.getenv("REFERRAL_NEGATIVE_TTL", "15"))
+
+# values: serialized Shop JSON (bytes), or None for an unknown code
+referral_cache = TTLCache("referral", REFERRAL_CACHE_SIZE, REFERRAL_CACHE_TTL)
+
+
+def remember_referral(referral_code: str, shop_body: bytes) -> None:
+    """
+    Call when a shop is created or its status/code changes.
+    """
+    referral_cache.set(referral_code, shop_body)
+
+
+def forget_referral(referral_code: str) -> None:
+    referral_cache.delete(referral_code)
@@ -1,24 +1,558 @@
-﻿import os
-from sqlalchemy import create_engine
+﻿import asyncio
+import contextlib
+import contextvars
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Generator, List, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.requests import Request, cookie_parser
+
+from .cache import MISSING, TTLCache
+
+logger = logging.getLogger("slh_db")
 
 # לוקחים מהסביבה (Railway נותן DATABASE_URL אוטומטית)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./slh_shop_core.db")
 
+# מצב עבודה של ה-routes מול ה-DB:
+#   "async" – AsyncSession על asyncpg (Postgres) / aiosqlite (SQLite)
+#   "sync"  – Session רגיל שרץ ב-threadpool (המצב הישן)
+DB_MODE = os.getenv("DB_MODE", "async").lower()
+
+# read replicas (Postgres): רשימת URLs מופרדת בפסיקים; routes של GET קוראים
+# מהן ב-round-robin. אחרי כתיבה, קריאות הולכות ל-primary למשך
+# READ_YOUR_WRITES_SECONDS (כדי לא לקרוא מ-replica שעוד לא התעדכנה):
+#   - הלקוח שכתב: cookie שחוזר בתשובת הכתיבה (READ_YOUR_WRITES_COOKIE) עם
+#     הישויות שנכתבו, כך שזה עובד גם כשהקריאה הבאה מגיעה ל-worker / replica
+#     אחר של ה-API. רק קריאות של הישויות האלה הולכות ל-primary, לא כל
+#     הקריאות של הלקוח (לקוח משותף כמו הבוט לא צריך לשמור את ה-cookie)
+#   - כל לקוח: לפי הישויות שנכתבו, בזיכרון של ה-worker שכתב בלבד
+DATABASE_READ_URLS = [u.strip() for u in os.getenv("DATABASE_READ_URLS", "").split(",") if u.strip()]
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_SIZE = int(os.getenv("READ_YOUR_WRITES_SIZE", "100000"))
+READ_YOUR_WRITES_COOKIE = os.getenv("READ_YOUR_WRITES_COOKIE", "slh_primary_until")
+# כמה ישויות לכל היותר נשמרות ב-cookie (החדשות קודם)
+READ_YOUR_WRITES_COOKIE_KEYS = int(os.getenv("READ_YOUR_WRITES_COOKIE_KEYS", "20"))
+
+# להריץ migrations אוטומטית בעליית ה-API (אחרת: python -m api.migrate)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# ==== פרופיל SQLite ====
+# pragmas לכל חיבור, writer יחיד עם group commit, ו-pool נפרד לקריאה בלבד.
+# לא רלוונטי ל-:memory: (כל חיבור רואה DB אחר).
+SQLITE_PROFILE = (
+    IS_SQLITE
+    and ":memory:" not in DATABASE_URL
+    and DATABASE_URL.rstrip("/") != "sqlite:"
+    and os.getenv("SQLITE_PROFILE", "1").lower() in ("1", "true", "yes")
+)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# שלילי = KiB (כאן 64MB לכל חיבור)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+# כמה כתיבות לכל היותר נכנסות ל-commit אחד
+SQLITE_WRITE_BATCH = int(os.getenv("SQLITE_WRITE_BATCH", "128"))
+
 connect_args = {}
 # רק ב-SQLite צריך check_same_thread
-if DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
+
+def sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    רץ על כל חיבור SQLite חדש (event "connect").
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+def sqlite_read_only(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def sqlite_writer_connect(dbapi_connection, connection_record) -> None:
+    # ה-driver לא פותח טרנזקציות בעצמו; BEGIN IMMEDIATE נשלח ב-event "begin"
+    dbapi_connection.isolation_level = None
+
+
+def sqlite_writer_begin(conn) -> None:
+    # נועל לכתיבה כבר בתחילת הטרנזקציה (בלי upgrade מ-read lock = בלי "database is locked")
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def apply_sqlite_profile(sync_engine, read_only: bool = False, writer: bool = False) -> None:
+    event.listen(sync_engine, "connect", sqlite_pragmas)
+    if read_only:
+        event.listen(sync_engine, "connect", sqlite_read_only)
+    if writer:
+        event.listen(sync_engine, "connect", sqlite_writer_connect)
+        event.listen(sync_engine, "begin", sqlite_writer_begin)
+
+
 engine = create_engine(
     DATABASE_URL,
     connect_args=connect_args,
     pool_pre_ping=True,
 )
+if SQLITE_PROFILE:
+    apply_sqlite_profile(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
-from typing import Generator
+
+
+def to_async_url(url: str) -> str:
+    """
+    ממיר DATABASE_URL רגיל ל-URL של driver אסינכרוני.
+    postgres:// / postgresql:// / postgresql+psycopg2:// -> postgresql+asyncpg://
+    sqlite:// -> sqlite+aiosqlite://
+    """
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return url
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_MODE == "async":
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    if SQLITE_PROFILE:
+        apply_sqlite_profile(async_engine.sync_engine)
+
+# ---- pool קריאה + writer (רק בפרופיל SQLite) ----
+# sessionmakers לקריאה: pool ה-query_only של SQLite, או ה-replicas
+read_sessionmakers: List[Any] = []
+WriterSessionLocal = None
+AsyncWriterSessionLocal = None
+extra_async_engines: List[Any] = []
+if SQLITE_PROFILE:
+    if DB_MODE == "async":
+        _async_read_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=SQLITE_READ_POOL_SIZE,
+            pool_pre_ping=True,
+        )
+        apply_sqlite_profile(_async_read_engine.sync_engine, read_only=True)
+        read_sessionmakers.append(
+            async_sessionmaker(bind=_async_read_engine, autoflush=False, expire_on_commit=False)
+        )
+
+        _async_writer_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+        )
+        apply_sqlite_profile(_async_writer_engine.sync_engine, writer=True)
+        AsyncWriterSessionLocal = async_sessionmaker(
+            bind=_async_writer_engine, autoflush=False, expire_on_commit=False
+        )
+        extra_async_engines = [_async_read_engine, _async_writer_engine]
+    else:
+        _read_engine = create_engine(
+            DATABASE_URL,
+            connect_args=connect_args,
+            pool_size=SQLITE_READ_POOL_SIZE,
+            pool_pre_ping=True,
+        )
+        apply_sqlite_profile(_read_engine, read_only=True)
+        read_sessionmakers.append(
+            sessionmaker(autocommit=False, autoflush=False, bind=_read_engine)
+        )
+
+        _writer_engine = create_engine(
+            DATABASE_URL,
+            connect_args=connect_args,
+            pool_size=1,
+            max_overflow=0,
+        )
+        apply_sqlite_profile(_writer_engine, writer=True)
+        WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=_writer_engine)
+
+# ---- read replicas ----
+elif DATABASE_READ_URLS:
+    for _url in DATABASE_READ_URLS:
+        if DB_MODE == "async":
+            _replica = create_async_engine(to_async_url(_url), pool_pre_ping=True)
+            extra_async_engines.append(_replica)
+            read_sessionmakers.append(
+                async_sessionmaker(bind=_replica, autoflush=False, expire_on_commit=False)
+            )
+        else:
+            _replica = create_engine(_url, pool_pre_ping=True)
+            read_sessionmakers.append(
+                sessionmaker(autocommit=False, autoflush=False, bind=_replica)
+            )
+
+_read_cycle = itertools.cycle(read_sessionmakers)
+# ב-SQLite ה-pool לקריאה רואה כל commit מיד; רק replicas צריכות את החלון
+USE_READ_REPLICAS = bool(DATABASE_READ_URLS) and not SQLITE_PROFILE
+
+# ישויות שנכתבו לאחרונה: ("users", id) / ("shops", id) / ...
+# (per-worker; בין workers ה-cookie הוא שמבטיח read-your-writes)
+recent_writes = TTLCache("recent_writes", READ_YOUR_WRITES_SIZE, READ_YOUR_WRITES_SECONDS)
+
+# path/query params של routes הקריאה -> סוג הישות
+READ_KEY_PARAMS = {
+    "user_id": "users",
+    "owner_user_id": "users",
+    "shop_id": "shops",
+    "item_id": "items",
+    "order_id": "orders",
+}
+
+
+# הישויות שהבקשה הנוכחית כתבה (נקבע ע"י ReadYourWritesMiddleware)
+_request_wrote: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "request_wrote", default=None
+)
+
+
+def mark_written(*keys: Tuple[str, Any]) -> None:
+    """
+    לקרוא אחרי commit: קריאות של הישויות האלה הולכות ל-primary בחלון הקרוב,
+    והן נכנסות ל-cookie של read-your-writes בתשובה לבקשה הזו.
+    """
+    if not USE_READ_REPLICAS:
+        return
+    keys = [(kind, str(entity_id)) for kind, entity_id in keys]
+    for key in keys:
+        recent_writes.set(key, True)
+    wrote = _request_wrote.get()
+    if wrote is not None:
+        wrote.extend(keys)
+
+
+def _cookie_keys(value: str | None) -> List[Tuple[str, str]]:
+    """
+    ערך ה-cookie ("<until>/users:<id>.orders:<id>") -> הישויות שעדיין בחלון.
+    """
+    if not value:
+        return []
+    until, _, keys = value.partition("/")
+    try:
+        if float(until) <= time.time():
+            return []
+    except ValueError:
+        return []
+    return [tuple(key.split(":", 1)) for key in keys.split(".") if ":" in key]
+
+
+def _cookie_value(keys: List[Tuple[str, str]]) -> str:
+    until = math.ceil(time.time() + READ_YOUR_WRITES_SECONDS)
+    return f"{until}/" + ".".join(f"{kind}:{entity_id}" for kind, entity_id in keys)
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware: תשובה של בקשה שכתבה (mark_written) מקבלת cookie עם
+    הישויות שנכתבו (יחד עם אלה שעוד בחלון מה-cookie הקודם) והזמן שעד אליו
+    קריאות שלהן הולכות ל-primary. get_read_db בודק אותו, כך שה-read-your-writes
+    לא תלוי באיזה worker מקבל את הקריאה.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not USE_READ_REPLICAS:
+            await self.app(scope, receive, send)
+            return
+
+        wrote: list = []
+        token = _request_wrote.set(wrote)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and wrote:
+                cookies = cookie_parser(Headers(scope=scope).get("cookie", ""))
+                previous = _cookie_keys(cookies.get(READ_YOUR_WRITES_COOKIE))
+                keys = list(dict.fromkeys([*reversed(wrote), *previous]))
+                value = _cookie_value(keys[:READ_YOUR_WRITES_COOKIE_KEYS])
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={value}; "
+                    f"Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _request_wrote.reset(token)
+
+
+async def needs_primary(request: Request) -> bool:
+    # ישויות שהלקוח עצמו כתב (cookie), או שנכתבו ב-worker הזה
+    client_wrote = set(_cookie_keys(request.cookies.get(READ_YOUR_WRITES_COOKIE)))
+
+    def written(kind: str, entity_id: Any) -> bool:
+        key = (kind, str(entity_id))
+        return key in client_wrote or recent_writes.get(key) is not MISSING
+
+    for params in (request.path_params, request.query_params):
+        for name, kind in READ_KEY_PARAMS.items():
+            value = params.get(name)
+            if value is not None and written(kind, value):
+                return True
+
+    # batch lookups: /items?ids=a,b או POST /items:lookup {"ids": [...]}
+    ids = request.query_params.get("ids")
+    ids = ids.split(",") if ids else []
+    if request.method == "POST":
+        body = await request.json()  # כבר נקרא ע"י FastAPI, נשמר על ה-request
+        if isinstance(body, dict) and isinstance(body.get("ids"), list):
+            ids += body["ids"]
+    if ids:
+        kind = request.url.path.strip("/").split("/")[0].split(":")[0]
+        return any(written(kind, i) for i in ids)
+    return False
+
+
+class ThreadedSession:
+    """
+    עטיפה ל-Session סינכרוני עם אותו API כמו AsyncSession (המתודות שבשימוש).
+    כל פעולת DB רצה ב-threadpool, כך שה-routes כתובים פעם אחת (async)
+    ועובדים גם כש-DB_MODE=sync.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    def _execute_buffered(self, statement, *args, **kwargs):
+        # כמו AsyncSession: כל השורות נשלפות (ואובייקטי ה-ORM נבנים) כבר
+        # ב-threadpool, כך ש-.all()/.one() על התוצאה לא נוגעים ב-DB מתוך ה-event loop
+        result = self.sync_session.execute(statement, *args, **kwargs)
+        if not getattr(result, "returns_rows", True):
+            return result
+        return result.freeze()()
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self._execute_buffered, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        result = await self.execute(statement, *args, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def flush(self, objects=None) -> None:
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def begin_nested(self):
+        """
+        SAVEPOINT, כמו `async with AsyncSession.begin_nested()`.
+        """
+        nested = await run_in_threadpool(self.sync_session.begin_nested)
+        try:
+            yield nested
+        except BaseException:
+            await run_in_threadpool(nested.rollback)
+            raise
+        else:
+            await run_in_threadpool(nested.commit)
+
+
+class SQLiteWriter:
+    """
+    writer יחיד ל-SQLite: כל הכתיבות נכנסות לתור ומשימה אחת מריצה אותן
+    ברצף על חיבור אחד. כל מה שהצטבר בתור בזמן ה-commit הקודם נכנס
+    לטרנזקציה אחת (group commit  fsync אחד לכל batch).
+
+    כל כתיבה רצה בתוך SAVEPOINT, כך שכשל של בקשה אחת לא מפיל את השאר;
+    התוצאה או השגיאה חוזרת לכל בקשה ב-future משלה, רק אחרי ה-commit.
+    """
+
+    def __init__(self, max_batch: int):
+        self.max_batch = max_batch
+        self._loop = None
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.batches = 0
+        self.writes = 0
+
+    def _session(self):
+        if AsyncWriterSessionLocal is not None:
+            return AsyncWriterSessionLocal()
+        return ThreadedSession(WriterSessionLocal(expire_on_commit=False))
+
+    async def submit(self, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # event loop חדש (למשל בבדיקות)  מתחילים writer חדש
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        self._queue.put_nowait((fn, future))
+        return await future
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+            self._loop = None
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write_batch(batch)
+            except BaseException as exc:
+                # ה-writer חייב לשרוד: רק ה-batch הזה נכשל (session שלא נפתח,
+                # BaseException מ-fn וכו'); ביטול / יציאה ממשיכים למעלה
+                self._fail(batch, exc)
+                if isinstance(exc, (asyncio.CancelledError, KeyboardInterrupt, SystemExit)):
+                    raise
+                logger.exception("SQLite writer batch of %s write(s) failed", len(batch))
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Callable, asyncio.Future]], exc: BaseException) -> None:
+        for _, future in batch:
+            if future.done():
+                continue
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+
+    async def _write_batch(self, batch: List[Tuple[Callable, asyncio.Future]]) -> None:
+        outcomes = []
+        session = self._session()
+        try:
+            for fn, future in batch:
+                if future.cancelled():
+                    continue
+                try:
+                    async with session.begin_nested():
+                        outcomes.append((future, None, await fn(session)))
+                except Exception as exc:
+                    outcomes.append((future, exc, None))
+            await session.commit()
+        except Exception as exc:
+            # ה-commit (או החיבור) נכשל  אף כתיבה ב-batch לא נשמרה
+            outcomes = [(future, exc, None) for future, _, _ in outcomes]
+        finally:
+            try:
+                await session.close()
+            except Exception:
+                # ה-commit כבר הצליח (או נכשל)  התוצאות נשארות כמו שהן
+                logger.exception("Closing the SQLite writer session failed")
+
+        self.batches += 1
+        self.writes += len(outcomes)
+        for future, exc, result in outcomes:
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+sqlite_writer = SQLiteWriter(SQLITE_WRITE_BATCH) if SQLITE_PROFILE else None
+
+
+async def run_write(db, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+    """
+    מריץ fn(session) כטרנזקציית כתיבה אחת ומחזיר את התוצאה שלה.
+    fn לא עושה commit/rollback בעצמה.
+    בפרופיל SQLite  דרך ה-writer היחיד (db לא בשימוש); אחרת על ה-session
+    של הבקשה ואז commit.
+    """
+    if sqlite_writer is not None:
+        return await sqlite_writer.submit(fn)
+    result = await fn(db)
+    await db.commit()
+    return result
+
+
+def open_session():
+    """
+    session עצמאי (לא של בקשה), למשימות רקע: AsyncSession או ThreadedSession
+    לפי DB_MODE. הקורא אחראי ל-close().
+    """
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal()
+    return ThreadedSession(SessionLocal(expire_on_commit=False))
+
 
 def get_db() -> Generator:
     """
@@ -30,3 +564,45 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    """
+    Dependency אסינכרוני: AsyncSession במצב async,
+    או ThreadedSession מעל SessionLocal במצב sync.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
+    db = ThreadedSession(SessionLocal(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def get_read_db(request: Request) -> AsyncGenerator:
+    """
+    Dependency ל-routes של קריאה בלבד (GET, ו-POST של lookup).
+    בפרופיל SQLite  pool נפרד עם query_only; עם DATABASE_READ_URLS 
+    replica ב-round-robin (או ה-primary אם הלקוח / הישות כתבו זה עתה);
+    אחרת כמו get_async_db.
+    """
+    if not read_sessionmakers or (USE_READ_REPLICAS and await needs_primary(request)):
+        async for db in get_async_db():
+            yield db
+        return
+
+    factory = next(_read_cycle)
+    if DB_MODE == "async":
+        async with factory() as db:
+            yield db
+        return
+
+    db = ThreadedSession(factory(expire_on_commit=False))
+    try:
+        yield db
+    finally:
+        await db.close()
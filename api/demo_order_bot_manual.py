@@ -1,18 +1,23 @@
-﻿import uuid
+﻿from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, select
 
-from .db import get_db
+from .db import get_async_db, mark_written, run_write
+from .idempotency import fingerprint, idempotency_key_header, idempotency_store
+from .models import Item as ItemModel, Order as OrderModel, Shop as ShopModel, User as UserModel
+from .order_batch import order_batcher
 
 router = APIRouter(prefix="/shops", tags=["shops"])
 
 
 @router.get("/demo-order-bot")
-def create_demo_order_bot(
+async def create_demo_order_bot(
     telegram_id: int = Query(..., description="Telegram user id"),
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Endpoint דמו עבור הבוט:
@@ -21,82 +26,117 @@ def create_demo_order_bot(
       - telegram_id: מזהה המשתמש בטלגרם
 
     לוגיקה:
-      - מאתר משתמש בטבלה public."users" לפי telegram_id
+      - מאתר משתמש לפי telegram_id
       - בוחר חנות דמו כלשהי (הראשונה בזמינות)
       - בוחר פריט כלשהו מהחנות (הראשון בזמינות)
-      - יוצר רשומת הזמנה בטבלה public."orders"
+      - יוצר רשומת הזמנה
       - מחזיר JSON ידידותי לבוט
+
+    עם Idempotency-Key (הבוט שולח tg-<update_id>) ניסיון חוזר מחזיר את
+    אותה הזמנה ולא יוצר הזמנה כפולה.
     """
+    return await idempotency_store.run(
+        "shops.demo-order-bot",
+        idempotency_key,
+        fingerprint(telegram_id),
+        lambda: _create_demo_order(telegram_id, db),
+    )
+
+
+async def _create_demo_order(telegram_id: int, db: AsyncSession) -> ORJSONResponse:
+    if order_batcher is not None:
+        buyer, shop, item = await _demo_order_rows(telegram_id, db)
+        # group commit יחד עם הזמנות אחרות שמגיעות באותו חלון
+        # לא מחזיקים את טרנזקציית הקריאה (והחיבור) בזמן ההמתנה
+        await db.rollback()
+        order = await order_batcher.insert(_demo_order_values(buyer, shop, item))
+        order_id = order.id
+    else:
+        # קריאה + INSERT כטרנזקציית כתיבה אחת (בפרופיל SQLite  דרך ה-writer היחיד)
+        buyer, shop, item, order_id = await run_write(
+            db, lambda s: _insert_demo_order(telegram_id, s)
+        )
+
+    mark_written(("users", buyer.id), ("orders", order_id))
+    return _demo_order_response(order_id, buyer, shop, item, float(item.price_slh))
 
+
+async def _demo_order_rows(telegram_id: int, db: AsyncSession):
     # 1) למצוא משתמש (buyer)
-    buyer = db.execute(
-        text('SELECT id, display_name FROM public."users" WHERE telegram_id = :tid'),
-        {"tid": telegram_id},
-    ).fetchone()
+    buyer = (
+        await db.execute(
+            select(UserModel.id, UserModel.display_name).where(
+                UserModel.telegram_id == telegram_id
+            )
+        )
+    ).first()
 
     if not buyer:
         raise HTTPException(status_code=404, detail="User not found for given telegram_id")
 
     # 2) לבחור חנות דמו כלשהי
-    shop = db.execute(
-        text('SELECT id, name FROM public."shops" ORDER BY created_at LIMIT 1')
-    ).fetchone()
+    shop = (
+        await db.execute(
+            select(ShopModel.id, ShopModel.title.label("name"))
+            .order_by(ShopModel.created_at)
+            .limit(1)
+        )
+    ).first()
 
     if not shop:
         raise HTTPException(status_code=400, detail="No demo shop configured in database")
 
     # 3) לבחור פריט דמו מהחנות
-    item = db.execute(
-        text(
-            'SELECT id, name, price_slh '
-            'FROM public."items" '
-            'WHERE shop_id = :sid '
-            "ORDER BY created_at LIMIT 1"
-        ),
-        {"sid": shop.id},
-    ).fetchone()
+    item = (
+        await db.execute(
+            select(ItemModel.id, ItemModel.name, ItemModel.price_slh)
+            .where(ItemModel.shop_id == shop.id)
+            .order_by(ItemModel.created_at)
+            .limit(1)
+        )
+    ).first()
 
     if not item:
         raise HTTPException(status_code=400, detail="No demo item configured for demo shop")
 
-    # 4) ליצור הזמנה חדשה
-    order_id = str(uuid.uuid4())
-    amount_slh = float(item.price_slh)
-
-    db.execute(
-        text(
-            '''
-            INSERT INTO public."orders"
-            (id, buyer_user_id, shop_id, item_id,
-             amount_slh, amount_bnb,
-             status, tx_hash,
-             created_at, updated_at, payment_proof_url)
-            VALUES
-            (:id, :buyer, :shop, :item,
-             :amount_slh, NULL,
-             :status, NULL,
-             NOW(), NOW(), NULL)
-            '''
-        ),
-        {
-            "id": order_id,
-            "buyer": buyer.id,
-            "shop": shop.id,
-            "item": item.id,
-            "amount_slh": amount_slh,
-            "status": "pending",
-        },
-    )
-    db.commit()
+    return buyer, shop, item
 
-    # 5) להחזיר JSON לבוט
+
+def _demo_order_values(buyer, shop, item) -> dict:
+    # 4) ערכי ההזמנה החדשה
+    # amount_slh הוא varchar: נשמר כמחרוזת (asyncpg לא מקבל float לעמודת טקסט),
+    # ה-float רק לתשובת ה-JSON
     return {
-        "ok": True,
-        "order_id": order_id,
-        "item_name": item.name,
-        "amount_slh": amount_slh,
-        "payment_address": "0xACb0A09414CEA1C879c67bB7A877E4e19480f022",
-        "chain_id": 56,
-        "shop": shop.name,
-        "buyer": buyer.display_name,
+        "buyer_user_id": buyer.id,
+        "shop_id": shop.id,
+        "item_id": item.id,
+        "amount_slh": str(item.price_slh),
+        "amount_bnb": None,
+        "status": "pending",
     }
+
+
+async def _insert_demo_order(telegram_id: int, db: AsyncSession):
+    buyer, shop, item = await _demo_order_rows(telegram_id, db)
+    order_id = await db.scalar(
+        insert(OrderModel)
+        .values(**_demo_order_values(buyer, shop, item))
+        .returning(OrderModel.id)
+    )
+    return buyer, shop, item, order_id
+
+
+def _demo_order_response(order_id: str, buyer, shop, item, amount_slh: float) -> ORJSONResponse:
+    # 5) להחזיר JSON לבוט
+    return ORJSONResponse(
+        {
+            "ok": True,
+            "order_id": order_id,
+            "item_name": item.name,
+            "amount_slh": amount_slh,
+            "payment_address": "0xACb0A09414CEA1C879c67bB7A877E4e19480f022",
+            "chain_id": 56,
+            "shop": shop.name,
+            "buyer": buyer.display_name,
+        }
+    )
@@ -0,0 +1,64 @@
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import select
+
+from .models import Item as ItemModel, Order as OrderModel, Shop as ShopModel
+
+# expand name -> (related model, order FK column, summary fields)
+ORDER_EXPANSIONS: Dict[str, Tuple[type, object, Tuple[str, ...]]] = {
+    "item": (ItemModel, OrderModel.item_id, ("name", "image_url", "price_slh", "price_bnb")),
+    "shop": (ShopModel, OrderModel.shop_id, ("title", "slug", "status")),
+}
+
+
+def order_expand_query(
+    expand: Optional[str] = Query(None, description="Comma separated: item,shop"),
+) -> List[str]:
+    """
+    Query param shared by the order list endpoints: ?expand=item,shop
+    """
+    if not expand:
+        return []
+    names = list(dict.fromkeys(n.strip() for n in expand.split(",") if n.strip()))
+    unknown = [n for n in names if n not in ORDER_EXPANSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown expand: {', '.join(unknown)} (allowed: item, shop)",
+        )
+    return names
+
+
+def expanded_orders_select(expand: List[str]):
+    """
+    Order columns plus the summary columns of every expanded relation,
+    outer-joined into one statement: plain rows, no ORM entities and no
+    lazy loads. Related columns are labelled "<name>__<field>".
+    """
+    stmt = select(*OrderModel.__table__.c)
+    for name in expand:
+        model, fk, fields = ORDER_EXPANSIONS[name]
+        stmt = stmt.add_columns(
+            model.id.label(f"{name}__id"),
+            *(getattr(model, field).label(f"{name}__{field}") for field in fields),
+        ).outerjoin(model, model.id == fk)
+    return stmt
+
+
+def embed_summaries(rows, expand: List[str]) -> List[dict]:
+    """
+    Rows of expanded_orders_select -> order dicts with the related
+    summaries nested under "item" / "shop" (None if the row is gone).
+    """
+    result = []
+    for row in rows:
+        data = dict(row._mapping)
+        for name in expand:
+            _, _, fields = ORDER_EXPANSIONS[name]
+            summary = {"id": data.pop(f"{name}__id")}
+            for field in fields:
+                summary[field] = data.pop(f"{name}__{field}")
+            data[name] = summary if summary["id"] is not None else None
+        result.append(data)
+    return result
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Header, HTTPException, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .cache import MISSING, TTLCache
+from .db import open_session, run_write
+from .models import IdempotencyKey
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "50000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+# how long a claimed key may stay unfinished before another request takes
+# it over (the worker that claimed it died mid-call)
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))
+IDEMPOTENCY_POLL_INTERVAL = float(os.getenv("IDEMPOTENCY_POLL_INTERVAL", "0.05"))
+# every N claims, expired rows are deleted
+IDEMPOTENCY_PURGE_EVERY = int(os.getenv("IDEMPOTENCY_PURGE_EVERY", "1000"))
+
+
+def idempotency_key_header(
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+) -> Optional[str]:
+    """
+    Dependency for the optional Idempotency-Key header. The bot sends
+    tg-<update_id> so that a redelivered Telegram update maps to the same key.
+    """
+    return idempotency_key or None
+
+
+def fingerprint(*parts: object) -> str:
+    raw = "\x1f".join(str(p) for p in parts).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Remembers the response of a write by (scope, Idempotency-Key) for
+    IDEMPOTENCY_TTL seconds, in the idempotency_keys table, so a retry gets
+    the stored response back whichever worker or API replica it reaches.
+
+    Insert first: a request claims its key by inserting the row, and only
+    the request that inserted it runs the handler. A retry that hits the
+    existing row replays the stored response, or waits while the first
+    call is still running. Only 2xx responses are stored; after a failure
+    the row is deleted, so the call can be retried for real.
+
+    Stored responses are also kept in memory, and a retry arriving in the
+    same worker waits on the running call instead of polling the table.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, lease: float):
+        self.ttl = ttl
+        self.lease = lease
+        self._responses = TTLCache("idempotency", maxsize, ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._claims = itertools.count(1)
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        if key is None:
+            return await handler()
+
+        cache_key = (scope, key)
+        while True:
+            stored = self._responses.get(cache_key)
+            if stored is not MISSING:
+                return self._replay(stored, request_fingerprint)
+
+            pending = self._inflight.get(cache_key)
+            if pending is None:
+                break
+            await asyncio.shield(pending)
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = done
+        try:
+            return await self._run_claimed(scope, key, request_fingerprint, handler)
+        finally:
+            del self._inflight[cache_key]
+            done.set_result(None)
+
+    async def _run_claimed(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        deadline = time.monotonic() + self.lease + 1
+        while not await self._claim(scope, key, request_fingerprint):
+            row = await self._load(scope, key)
+            if row is None:
+                continue  # the other call failed and released the key
+            stored = (row.fingerprint, row.status_code, row.body, row.media_type)
+            if row.status_code is not None:
+                self._responses.set((scope, key), stored)
+                return self._replay(stored, request_fingerprint)
+            if row.fingerprint != request_fingerprint:
+                return self._replay(stored, request_fingerprint)  # 422
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                )
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+        try:
+            response = await handler()
+        except BaseException:
+            await self._release(scope, key)
+            raise
+        if not 200 <= response.status_code < 300:
+            await self._release(scope, key)
+            return response
+
+        stored = (request_fingerprint, response.status_code, response.body, response.media_type)
+        await self._complete(scope, key, stored)
+        self._responses.set((scope, key), stored)
+        return response
+
+    # ---- idempotency_keys ----
+
+    @staticmethod
+    async def _write(fn):
+        session = open_session()
+        try:
+            return await run_write(session, fn)
+        finally:
+            await session.close()
+
+    async def _claim(self, scope: str, key: str, request_fingerprint: str) -> bool:
+        """
+        True if this request now owns the key: it inserted the row, or took
+        over a row whose lease or TTL ran out.
+        """
+        if next(self._claims) % IDEMPOTENCY_PURGE_EVERY == 0:
+            await self._purge_expired()
+
+        now = datetime.utcnow()
+        values = {
+            "fingerprint": request_fingerprint,
+            "status_code": None,
+            "body": None,
+            "media_type": None,
+            "expires_at": now + timedelta(seconds=self.lease),
+        }
+
+        async def insert_row(session):
+            await session.execute(insert(IdempotencyKey).values(scope=scope, key=key, **values))
+            return True
+
+        try:
+            return await self._write(insert_row)
+        except IntegrityError:
+            pass
+
+        async def take_over(session):
+            result = await session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.expires_at < now,
+                )
+                .values(**values)
+            )
+            return result.rowcount == 1
+
+        return await self._write(take_over)
+
+    @staticmethod
+    async def _load(scope: str, key: str) -> Optional[IdempotencyKey]:
+        session = open_session()
+        try:
+            return await session.scalar(
+                select(IdempotencyKey).where(
+                    IdempotencyKey.scope == scope, IdempotencyKey.key == key
+                )
+            )
+        finally:
+            await session.close()
+
+    async def _complete(self, scope: str, key: str, stored: tuple) -> None:
+        _, status_code, body, media_type = stored
+
+        async def save(session):
+            await session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                .values(
+                    status_code=status_code,
+                    body=body,
+                    media_type=media_type,
+                    expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+                )
+            )
+
+        await self._write(save)
+
+    async def _release(self, scope: str, key: str) -> None:
+        async def release(session):
+            await session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.status_code.is_(None),
+                )
+            )
+
+        await self._write(release)
+
+    async def _purge_expired(self) -> None:
+        async def purge(session):
+            await session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+            )
+
+        await self._write(purge)
+
+    @staticmethod
+    def _replay(stored: tuple, request_fingerprint: str) -> Response:
+        stored_fingerprint, status_code, body, media_type = stored
+        if stored_fingerprint != request_fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request",
+            )
+        return Response(
+            content=body,
+            status_code=status_code,
+            media_type=media_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL, IDEMPOTENCY_LEASE)
@@ -0,0 +1,53 @@
+from typing import Dict, Generic, List, TypeVar
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+
+T = TypeVar("T")
+
+LOOKUP_MAX_IDS = 200
+
+
+class Lookup(BaseModel, Generic[T]):
+    items: Dict[str, T]
+    missing: List[str] = []
+
+
+class LookupRequest(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=LOOKUP_MAX_IDS)
+
+
+def unique_ids(ids: List[str]) -> List[str]:
+    """
+    Drops blanks and duplicates, keeps the client's order.
+    """
+    return list(dict.fromkeys(i for i in ids if i))
+
+
+def ids_query(
+    ids: str = Query(..., description=f"Comma separated ids, up to {LOOKUP_MAX_IDS}"),
+) -> List[str]:
+    """
+    Query param shared by the batch GET endpoints: ?ids=a,b,c
+    """
+    parsed = unique_ids([i.strip() for i in ids.split(",")])
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids is empty")
+    if len(parsed) > LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {LOOKUP_MAX_IDS} ids per lookup")
+    return parsed
+
+
+async def lookup(db, model, ids: List[str], stmt=None) -> dict:
+    """
+    Every requested row in one `WHERE id IN (...)` query.
+    Returns {"items": {id: row}, "missing": [ids not found]}.
+    With stmt (a select of plain columns, including id) the rows are Row objects.
+    """
+    if stmt is None:
+        rows = (await db.scalars(select(model).where(model.id.in_(ids)))).all()
+    else:
+        rows = (await db.execute(stmt.where(model.id.in_(ids)))).all()
+    found = {row.id: row for row in rows}
+    return {"items": found, "missing": [i for i in ids if i not in found]}
@@ -6,40 +6,67 @@ from __future__ import annotations
 import json
 from datetime import datetime
 from typing import List, Optional, Dict, Any, Literal
-from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-
-from .db import SessionLocal, engine
+from fastapi import FastAPI, HTTPException, Depends, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, field_validator
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import (
+    MISSING,
+    REFERRAL_NEGATIVE_TTL,
+    cache_stats,
+    catalog_cache,
+    invalidate_shop_catalog,
+    item_tag,
+    referral_cache,
+    remember_referral,
+    shop_tag,
+)
+from .db import (
+    AUTO_MIGRATE,
+    DB_MODE,
+    SQLITE_PROFILE,
+    USE_READ_REPLICAS,
+    ReadYourWritesMiddleware,
+    async_engine,
+    engine,
+    extra_async_engines,
+    get_async_db,
+    get_read_db,
+    mark_written,
+    recent_writes,
+    run_write,
+    sqlite_writer,
+)
+from .demo_order_bot_manual import router as demo_order_bot_router
+from .expand import embed_summaries, expanded_orders_select, order_expand_query
+from .idempotency import fingerprint, idempotency_key_header, idempotency_store
+from .migrate import run_migrations
+from .lookup import Lookup, LookupRequest, ids_query, lookup, unique_ids
+from .order_batch import order_batcher
 from .models import (
-    Base,
     User as UserModel,
     Shop as ShopModel,
     Item as ItemModel,
     Order as OrderModel,
 )
+from .pagination import Page, PageParams, paginate
 from .payments_manual import router as payments_router
+from .proof_storage import PROOF_URL_PREFIX, proof_storage
+from .serializers import Serializer, parse_metadata_json
 
-# ×œ×™×¦×•×¨ ×ک×‘×œ×گ×•×ھ ×گ×‌ ×œ×گ ×§×™×™×‍×•×ھ
-Base.metadata.create_all(bind=engine)
+# schema: apply pending migrations (migrations/*.sql|py) on startup
+if AUTO_MIGRATE:
+    run_migrations(engine)
 
 
 def now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
 
-# ×ھ×œ×•×ھ ×œ-SQLAlchemy Session ×œ×›×œ ×‘×§×©×”
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # =============================
 # Pydantic Models
 # =============================
@@ -53,6 +80,8 @@ class UserCreateFromTelegram(BaseModel):
 
 
 class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     telegram_id: int
     telegram_username: Optional[str] = None
@@ -60,8 +89,8 @@ class User(BaseModel):
     bnb_address: Optional[str] = None
     ton_address: Optional[str] = None
     referrer_id: Optional[str] = None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
 
 class ShopCreate(BaseModel):
@@ -72,6 +101,8 @@ class ShopCreate(BaseModel):
 
 
 class Shop(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     owner_user_id: str
     title: str
@@ -80,8 +111,8 @@ class Shop(BaseModel):
     shop_type: str
     status: str
     referral_code: str
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
 
 class ItemCreate(BaseModel):
@@ -95,6 +126,8 @@ class ItemCreate(BaseModel):
 
 
 class Item(BaseModel):
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
     id: str
     shop_id: str
     name: str
@@ -103,9 +136,15 @@ class Item(BaseModel):
     price_slh: Optional[str] = None
     price_bnb: Optional[str] = None
     price_nis: Optional[float] = None
-    metadata: Dict[str, Any] = Field(default_factory=dict)
-    created_at: str
-    updated_at: str
+    # ORM rows carry it as the metadata_json string
+    metadata: Dict[str, Any] = Field(
+        default_factory=dict,
+        validation_alias=AliasChoices("metadata_json", "metadata"),
+    )
+    created_at: datetime
+    updated_at: datetime
+
+    _parse_metadata = field_validator("metadata", mode="before")(parse_metadata_json)
 
 
 class OrderCreate(BaseModel):
@@ -123,6 +162,8 @@ class PaymentInstructions(BaseModel):
 
 
 class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     buyer_user_id: str
     shop_id: str
@@ -131,8 +172,29 @@ class Order(BaseModel):
     amount_bnb: Optional[str] = None
     status: str
     tx_hash: Optional[str] = None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class ItemSummary(BaseModel):
+    id: str
+    name: str
+    image_url: Optional[str] = None
+    price_slh: Optional[str] = None
+    price_bnb: Optional[str] = None
+
+
+class ShopSummary(BaseModel):
+    id: str
+    title: str
+    slug: str
+    status: str
+
+
+class OrderExpanded(Order):
+    # filled only for the relations named in ?expand=item,shop
+    item: Optional[ItemSummary] = None
+    shop: Optional[ShopSummary] = None
 
 
 class OrderWithPayment(BaseModel):
@@ -140,6 +202,23 @@ class OrderWithPayment(BaseModel):
     payment_instructions: PaymentInstructions
 
 
+# ORM -> JSON serializers (see serializers.py)
+user_out = Serializer(User)
+shop_out = Serializer(Shop)
+shop_page_out = Serializer(Page[Shop])
+item_out = Serializer(Item)
+item_page_out = Serializer(Page[Item])
+order_out = Serializer(Order)
+order_page_out = Serializer(Page[Order])
+order_expanded_page_out = Serializer(Page[OrderExpanded])
+order_with_payment_out = Serializer(OrderWithPayment)
+user_lookup_out = Serializer(Lookup[User])
+shop_lookup_out = Serializer(Lookup[Shop])
+item_lookup_out = Serializer(Lookup[Item])
+order_lookup_out = Serializer(Lookup[Order])
+order_expanded_lookup_out = Serializer(Lookup[OrderExpanded])
+
+
 # demo payment config
 BSC_CHAIN_ID = 56
 SLH_TOKEN_ADDRESS = "0xACb0A09414CEA1C879c67bB7A877E4e19480f022"
@@ -153,22 +232,34 @@ app = FastAPI(
     title="SLH Shop Core API",
     version="0.1.0",
     description="Core API for SLH Shop-based ecosystem (with SQLite DB).",
+    default_response_class=ORJSONResponse,
 )
 
-# ---- Static files for uploaded_proofs ----
-BASE_DIR = Path(__file__).resolve().parent
-UPLOAD_ROOT = BASE_DIR.parent / "uploaded_proofs"
+# ---- Uploaded proofs, served by whichever proof storage is configured ----
+app.mount(
+    PROOF_URL_PREFIX,
+    proof_storage.asgi_app(),
+    name="uploaded_proofs",
+)
 
-if UPLOAD_ROOT.exists():
-    app.mount(
-        "/uploaded_proofs",
-        StaticFiles(directory=str(UPLOAD_ROOT)),
-        name="uploaded_proofs",
-    )
+# ---- read-your-writes cookie when reads go to replicas (see db.py) ----
+app.add_middleware(ReadYourWritesMiddleware)
 
 # ---- Include payments router (/payments/upload-proof) ----
 app.include_router(payments_router)
 
+# ---- /shops/demo-order-bot: included before /shops/{shop_id} would match it ----
+app.include_router(demo_order_bot_router)
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine() -> None:
+    if sqlite_writer is not None:
+        await sqlite_writer.close()
+    for eng in [async_engine, *extra_async_engines]:
+        if eng is not None:
+            await eng.dispose()
+
 
 # =============================
 # Health & Meta
@@ -192,27 +283,123 @@ def meta() -> Dict[str, Any]:
     }
 
 
+@app.get("/meta/cache")
+def meta_cache() -> Dict[str, Any]:
+    return cache_stats()
+
+
+@app.get("/meta/db")
+def meta_db() -> Dict[str, Any]:
+    return {
+        "dialect": engine.dialect.name,
+        "mode": DB_MODE,
+        "sqlite_profile": SQLITE_PROFILE,
+        "writer": sqlite_writer.stats() if sqlite_writer is not None else None,
+        "order_batch": order_batcher.stats() if order_batcher is not None else None,
+        "read_replicas": USE_READ_REPLICAS,
+        "recent_writes": recent_writes.stats(),
+    }
+
+
 # =============================
 # Users
 # =============================
 
 
 @app.post("/users/telegram-sync", response_model=User)
-def users_telegram_sync(
+async def users_telegram_sync(
+    payload: UserCreateFromTelegram,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    return await idempotency_store.run(
+        "users.telegram-sync",
+        idempotency_key,
+        fingerprint(payload.model_dump_json()),
+        lambda: _sync_telegram_user(payload, db),
+    )
+
+
+# dialects with INSERT ... ON CONFLICT ... RETURNING
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def _sync_telegram_user(payload: UserCreateFromTelegram, db: AsyncSession) -> Response:
+    if engine.dialect.name in UPSERT_INSERTS:
+        user, changed = await run_write(db, lambda s: _upsert_telegram_user(payload, s))
+    else:
+        user, changed = await run_write(db, lambda s: _sync_telegram_user_fallback(payload, s))
+    if changed:
+        # an unchanged /start wrote nothing, its reads can stay on the replicas
+        mark_written(("users", user.id))
+    return user_out.response(user)
+
+
+async def _upsert_telegram_user(payload: UserCreateFromTelegram, db: AsyncSession):
+    """
+    Returns (user, changed): changed is False when the stored profile was
+    already up to date and nothing was written.
+    """
+    insert = UPSERT_INSERTS[db.bind.dialect.name]
+
+    # empty/missing profile fields keep the stored value (like the old path)
+    stmt = insert(UserModel).values(
+        telegram_id=payload.telegram_id,
+        telegram_username=payload.telegram_username,
+        display_name=payload.display_name,
+    )
+    new_username = func.coalesce(
+        func.nullif(stmt.excluded.telegram_username, ""),
+        UserModel.telegram_username,
+    )
+    new_display_name = func.coalesce(
+        func.nullif(stmt.excluded.display_name, ""),
+        UserModel.display_name,
+    )
+    # one statement: insert, or update only when something actually changed;
+    # an unchanged profile returns no row and writes nothing
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserModel.telegram_id],
+        set_={
+            "telegram_username": new_username,
+            "display_name": new_display_name,
+            "updated_at": datetime.utcnow(),
+        },
+        where=(
+            UserModel.telegram_username.is_distinct_from(new_username)
+            | UserModel.display_name.is_distinct_from(new_display_name)
+        ),
+    ).returning(UserModel)
+
+    user = await db.scalar(stmt)
+    if user is not None:
+        return user, True
+    user = await db.scalar(
+        select(UserModel).where(UserModel.telegram_id == payload.telegram_id)
+    )
+    return user, False
+
+
+async def _sync_telegram_user_fallback(
     payload: UserCreateFromTelegram,
-    db: Session = Depends(get_db),
-) -> User:
-    user = db.query(UserModel).filter(
-        UserModel.telegram_id == payload.telegram_id
-    ).first()
+    db: AsyncSession,
+):
+    """
+    Same as _upsert_telegram_user, for dialects without ON CONFLICT.
+    """
+    user = await db.scalar(
+        select(UserModel).where(UserModel.telegram_id == payload.telegram_id)
+    )
 
     if user:
-        user.telegram_username = payload.telegram_username or user.telegram_username
-        user.display_name = payload.display_name or user.display_name
+        username = payload.telegram_username or user.telegram_username
+        display_name = payload.display_name or user.display_name
+        if (username, display_name) == (user.telegram_username, user.display_name):
+            return user, False
+        user.telegram_username = username
+        user.display_name = display_name
         user.updated_at = datetime.utcnow()
         db.add(user)
-        db.commit()
-        db.refresh(user)
     else:
         user = UserModel(
             telegram_id=payload.telegram_id,
@@ -223,79 +410,78 @@ def users_telegram_sync(
             referrer_id=None,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
-
-    return User(
-        id=user.id,
-        telegram_id=user.telegram_id,
-        telegram_username=user.telegram_username,
-        display_name=user.display_name,
-        bnb_address=user.bnb_address,
-        ton_address=user.ton_address,
-        referrer_id=user.referrer_id,
-        created_at=user.created_at.isoformat(),
-        updated_at=user.updated_at.isoformat(),
-    )
+
+    await db.flush()
+    return user, True
 
 
 @app.get("/users/{user_id}", response_model=User)
-def get_user(user_id: str, db: Session = Depends(get_db)) -> User:
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+async def get_user(user_id: str, db: AsyncSession = Depends(get_read_db)) -> Response:
+    user = await db.get(UserModel, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return User(
-        id=user.id,
-        telegram_id=user.telegram_id,
-        telegram_username=user.telegram_username,
-        display_name=user.display_name,
-        bnb_address=user.bnb_address,
-        ton_address=user.ton_address,
-        referrer_id=user.referrer_id,
-        created_at=user.created_at.isoformat(),
-        updated_at=user.updated_at.isoformat(),
-    )
+    return user_out.response(user)
+
+
+@app.get("/users", response_model=Lookup[User])
+async def lookup_users(
+    ids: List[str] = Depends(ids_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return user_lookup_out.response(await lookup(db, UserModel, ids))
 
 
-@app.get("/users/{user_id}/shops", response_model=List[Shop])
-def get_user_shops(user_id: str, db: Session = Depends(get_db)) -> List[Shop]:
-    shops = db.query(ShopModel).filter(ShopModel.owner_user_id == user_id).all()
-    return [
-        Shop(
-            id=s.id,
-            owner_user_id=s.owner_user_id,
-            title=s.title,
-            description=s.description,
-            slug=s.slug,
-            shop_type=s.shop_type,
-            status=s.status,
-            referral_code=s.referral_code,
-            created_at=s.created_at.isoformat(),
-            updated_at=s.updated_at.isoformat(),
+@app.post("/users:lookup", response_model=Lookup[User])
+async def lookup_users_post(
+    payload: LookupRequest,
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return user_lookup_out.response(await lookup(db, UserModel, unique_ids(payload.ids)))
+
+
+@app.get("/users/{user_id}/shops", response_model=Page[Shop])
+async def get_user_shops(
+    user_id: str,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    shops, next_cursor = await paginate(
+        db,
+        select(ShopModel).where(ShopModel.owner_user_id == user_id),
+        ShopModel,
+        page,
+    )
+    return shop_page_out.response({"items": shops, "next_cursor": next_cursor})
+
+
+@app.get("/users/{user_id}/orders", response_model=Page[OrderExpanded])
+async def get_user_orders(
+    user_id: str,
+    page: PageParams = Depends(),
+    expand: List[str] = Depends(order_expand_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    if expand:
+        # one joined query for the page, related rows as column summaries
+        rows, next_cursor = await paginate(
+            db,
+            expanded_orders_select(expand).where(OrderModel.buyer_user_id == user_id),
+            OrderModel,
+            page,
+            columns=True,
         )
-        for s in shops
-    ]
-
-
-@app.get("/users/{user_id}/orders", response_model=List[Order])
-def get_user_orders(user_id: str, db: Session = Depends(get_db)) -> List[Order]:
-    orders = db.query(OrderModel).filter(OrderModel.buyer_user_id == user_id).all()
-    return [
-        Order(
-            id=o.id,
-            buyer_user_id=o.buyer_user_id,
-            shop_id=o.shop_id,
-            item_id=o.item_id,
-            amount_slh=o.amount_slh,
-            amount_bnb=o.amount_bnb,
-            status=o.status,
-            tx_hash=o.tx_hash,
-            created_at=o.created_at.isoformat(),
-            updated_at=o.updated_at.isoformat(),
+        return order_expanded_page_out.response(
+            {"items": embed_summaries(rows, expand), "next_cursor": next_cursor}
         )
-        for o in orders
-    ]
+
+    orders, next_cursor = await paginate(
+        db,
+        select(OrderModel).where(OrderModel.buyer_user_id == user_id),
+        OrderModel,
+        page,
+    )
+    return order_page_out.response({"items": orders, "next_cursor": next_cursor})
 
 
 # =============================
@@ -304,8 +490,21 @@ def get_user_orders(user_id: str, db: Session = Depends(get_db)) -> List[Order]:
 
 
 @app.post("/shops", response_model=Shop)
-def create_shop(payload: ShopCreate, db: Session = Depends(get_db)) -> Shop:
-    owner = db.query(UserModel).filter(UserModel.id == payload.owner_user_id).first()
+async def create_shop(
+    payload: ShopCreate,
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    shop = await run_write(db, lambda s: _insert_shop(payload, s))
+    mark_written(("users", shop.owner_user_id), ("shops", shop.id))
+
+    body = shop_out.dumps(shop)
+    # warm the resolver (also replaces a cached "not found" for this code)
+    remember_referral(shop.referral_code, body)
+    return Response(content=body, media_type="application/json")
+
+
+async def _insert_shop(payload: ShopCreate, db: AsyncSession) -> ShopModel:
+    owner = await db.get(UserModel, payload.owner_user_id)
     if not owner:
         raise HTTPException(status_code=400, detail="Owner user not found")
 
@@ -324,91 +523,71 @@ def create_shop(payload: ShopCreate, db: Session = Depends(get_db)) -> Shop:
         referral_code=referral_code,
     )
     db.add(shop)
-    db.commit()
-    db.refresh(shop)
-
-    return Shop(
-        id=shop.id,
-        owner_user_id=shop.owner_user_id,
-        title=shop.title,
-        description=shop.description,
-        slug=shop.slug,
-        shop_type=shop.shop_type,
-        status=shop.status,
-        referral_code=shop.referral_code,
-        created_at=shop.created_at.isoformat(),
-        updated_at=shop.updated_at.isoformat(),
-    )
+    await db.flush()
+    return shop
 
 
 @app.get("/shops/{shop_id}", response_model=Shop)
-def get_shop(shop_id: str, db: Session = Depends(get_db)) -> Shop:
-    shop = db.query(ShopModel).filter(ShopModel.id == shop_id).first()
+async def get_shop(shop_id: str, db: AsyncSession = Depends(get_read_db)) -> Response:
+    shop = await db.get(ShopModel, shop_id)
     if not shop:
         raise HTTPException(status_code=404, detail="Shop not found")
 
-    return Shop(
-        id=shop.id,
-        owner_user_id=shop.owner_user_id,
-        title=shop.title,
-        description=shop.description,
-        slug=shop.slug,
-        shop_type=shop.shop_type,
-        status=shop.status,
-        referral_code=shop.referral_code,
-        created_at=shop.created_at.isoformat(),
-        updated_at=shop.updated_at.isoformat(),
-    )
+    return shop_out.response(shop)
+
+
+@app.get("/shops", response_model=Lookup[Shop])
+async def lookup_shops(
+    ids: List[str] = Depends(ids_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return shop_lookup_out.response(await lookup(db, ShopModel, ids))
+
+
+@app.post("/shops:lookup", response_model=Lookup[Shop])
+async def lookup_shops_post(
+    payload: LookupRequest,
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return shop_lookup_out.response(await lookup(db, ShopModel, unique_ids(payload.ids)))
 
 
-@app.get("/shops/by-owner/{owner_user_id}", response_model=List[Shop])
-def get_shops_by_owner(
+@app.get("/shops/by-owner/{owner_user_id}", response_model=Page[Shop])
+async def get_shops_by_owner(
     owner_user_id: str,
-    db: Session = Depends(get_db),
-) -> List[Shop]:
-    shops = db.query(ShopModel).filter(ShopModel.owner_user_id == owner_user_id).all()
-    return [
-        Shop(
-            id=s.id,
-            owner_user_id=s.owner_user_id,
-            title=s.title,
-            description=s.description,
-            slug=s.slug,
-            shop_type=s.shop_type,
-            status=s.status,
-            referral_code=s.referral_code,
-            created_at=s.created_at.isoformat(),
-            updated_at=s.updated_at.isoformat(),
-        )
-        for s in shops
-    ]
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    shops, next_cursor = await paginate(
+        db,
+        select(ShopModel).where(ShopModel.owner_user_id == owner_user_id),
+        ShopModel,
+        page,
+    )
+    return shop_page_out.response({"items": shops, "next_cursor": next_cursor})
 
 
 @app.get("/shops/by-referral/{referral_code}", response_model=Shop)
-def get_shop_by_referral(
+async def get_shop_by_referral(
     referral_code: str,
-    db: Session = Depends(get_db),
-) -> Shop:
-    shop = (
-        db.query(ShopModel)
-        .filter(ShopModel.referral_code == referral_code)
-        .first()
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    body = referral_cache.get(referral_code)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Shop not found for referral code")
+    if body is not MISSING:
+        return Response(content=body, media_type="application/json")
+
+    shop = await db.scalar(
+        select(ShopModel).where(ShopModel.referral_code == referral_code)
     )
     if not shop:
+        referral_cache.set(referral_code, None, ttl=REFERRAL_NEGATIVE_TTL)
         raise HTTPException(status_code=404, detail="Shop not found for referral code")
 
-    return Shop(
-        id=shop.id,
-        owner_user_id=shop.owner_user_id,
-        title=shop.title,
-        description=shop.description,
-        slug=shop.slug,
-        shop_type=shop.shop_type,
-        status=shop.status,
-        referral_code=shop.referral_code,
-        created_at=shop.created_at.isoformat(),
-        updated_at=shop.updated_at.isoformat(),
-    )
+    body = shop_out.dumps(shop)
+    referral_cache.set(referral_code, body)
+    return Response(content=body, media_type="application/json")
 
 
 # =============================
@@ -417,12 +596,20 @@ def get_shop_by_referral(
 
 
 @app.post("/shops/{shop_id}/items", response_model=Item)
-def create_item(
+async def create_item(
     shop_id: str,
     payload: ItemCreate,
-    db: Session = Depends(get_db),
-) -> Item:
-    shop = db.query(ShopModel).filter(ShopModel.id == shop_id).first()
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    item = await run_write(db, lambda s: _insert_item(shop_id, payload, s))
+    invalidate_shop_catalog(shop_id)
+    mark_written(("shops", shop_id), ("items", item.id))
+
+    return item_out.response(item)
+
+
+async def _insert_item(shop_id: str, payload: ItemCreate, db: AsyncSession) -> ItemModel:
+    shop = await db.get(ShopModel, shop_id)
     if not shop:
         raise HTTPException(status_code=404, detail="Shop not found")
 
@@ -439,69 +626,67 @@ def create_item(
         metadata_json=metadata_json,
     )
     db.add(item)
-    db.commit()
-    db.refresh(item)
-
-    return Item(
-        id=item.id,
-        shop_id=item.shop_id,
-        name=item.name,
-        description=item.description,
-        image_url=item.image_url,
-        price_slh=item.price_slh,
-        price_bnb=item.price_bnb,
-        price_nis=item.price_nis,
-        metadata=json.loads(item.metadata_json or "{}"),
-        created_at=item.created_at.isoformat(),
-        updated_at=item.updated_at.isoformat(),
-    )
+    await db.flush()
+    return item
 
 
-@app.get("/shops/{shop_id}/items", response_model=List[Item])
-def list_shop_items(shop_id: str, db: Session = Depends(get_db)) -> List[Item]:
-    shop = db.query(ShopModel).filter(ShopModel.id == shop_id).first()
+@app.get("/shops/{shop_id}/items", response_model=Page[Item])
+async def list_shop_items(
+    shop_id: str,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    cache_key = ("items", shop_id, page.limit, page.cursor, page.unpaginated)
+    body = catalog_cache.get(cache_key)
+    if body is not MISSING:
+        return Response(content=body, media_type="application/json")
+
+    shop = await db.get(ShopModel, shop_id)
     if not shop:
         raise HTTPException(status_code=404, detail="Shop not found")
 
-    items = db.query(ItemModel).filter(ItemModel.shop_id == shop_id).all()
-
-    return [
-        Item(
-            id=i.id,
-            shop_id=i.shop_id,
-            name=i.name,
-            description=i.description,
-            image_url=i.image_url,
-            price_slh=i.price_slh,
-            price_bnb=i.price_bnb,
-            price_nis=i.price_nis,
-            metadata=json.loads(i.metadata_json or "{}"),
-            created_at=i.created_at.isoformat(),
-            updated_at=i.updated_at.isoformat(),
-        )
-        for i in items
-    ]
+    rows, next_cursor = await paginate(
+        db,
+        select(ItemModel).where(ItemModel.shop_id == shop_id),
+        ItemModel,
+        page,
+    )
+
+    body = item_page_out.dumps({"items": rows, "next_cursor": next_cursor})
+    catalog_cache.set(cache_key, body, tags=[shop_tag(shop_id)])
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/items/{item_id}", response_model=Item)
-def get_item(item_id: str, db: Session = Depends(get_db)) -> Item:
-    item = db.query(ItemModel).filter(ItemModel.id == item_id).first()
+async def get_item(item_id: str, db: AsyncSession = Depends(get_read_db)) -> Response:
+    cache_key = ("item", item_id)
+    body = catalog_cache.get(cache_key)
+    if body is not MISSING:
+        return Response(content=body, media_type="application/json")
+
+    item = await db.get(ItemModel, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    return Item(
-        id=item.id,
-        shop_id=item.shop_id,
-        name=item.name,
-        description=item.description,
-        image_url=item.image_url,
-        price_slh=item.price_slh,
-        price_bnb=item.price_bnb,
-        price_nis=item.price_nis,
-        metadata=json.loads(item.metadata_json or "{}"),
-        created_at=item.created_at.isoformat(),
-        updated_at=item.updated_at.isoformat(),
-    )
+    body = item_out.dumps(item)
+    catalog_cache.set(cache_key, body, tags=[item_tag(item_id), shop_tag(item.shop_id)])
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/items", response_model=Lookup[Item])
+async def lookup_items(
+    ids: List[str] = Depends(ids_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return item_lookup_out.response(await lookup(db, ItemModel, ids))
+
+
+@app.post("/items:lookup", response_model=Lookup[Item])
+async def lookup_items_post(
+    payload: LookupRequest,
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return item_lookup_out.response(await lookup(db, ItemModel, unique_ids(payload.ids)))
 
 
 # =============================
@@ -510,18 +695,91 @@ def get_item(item_id: str, db: Session = Depends(get_db)) -> Item:
 
 
 @app.post("/orders", response_model=OrderWithPayment)
-def create_order(payload: OrderCreate, db: Session = Depends(get_db)) -> OrderWithPayment:
-    buyer = db.query(UserModel).filter(UserModel.id == payload.buyer_user_id).first()
-    if not buyer:
-        raise HTTPException(status_code=400, detail="Buyer user not found")
+async def create_order(
+    payload: OrderCreate,
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    return await idempotency_store.run(
+        "orders.create",
+        idempotency_key,
+        fingerprint(payload.model_dump_json()),
+        lambda: _create_order(payload, db),
+    )
 
-    shop = db.query(ShopModel).filter(ShopModel.id == payload.shop_id).first()
-    if not shop:
-        raise HTTPException(status_code=400, detail="Shop not found")
 
-    item = db.query(ItemModel).filter(ItemModel.id == payload.item_id).first()
-    if not item:
+def order_validation_query(payload: OrderCreate):
+    """
+    One row with everything create_order needs to validate the request:
+    buyer/shop existence (scalar subqueries) and the item, outer-joined so
+    a missing item still yields a row.
+    """
+    buyer_id = (
+        select(UserModel.id).where(UserModel.id == payload.buyer_user_id).scalar_subquery()
+    )
+    shop_id = (
+        select(ShopModel.id).where(ShopModel.id == payload.shop_id).scalar_subquery()
+    )
+    one = select(literal(1).label("one")).subquery()
+    return select(
+        buyer_id.label("buyer_id"),
+        shop_id.label("shop_id"),
+        ItemModel.id.label("item_id"),
+        ItemModel.shop_id.label("item_shop_id"),
+        ItemModel.price_slh,
+        ItemModel.price_bnb,
+    ).select_from(one.outerjoin(ItemModel, ItemModel.id == payload.item_id))
+
+
+async def _create_order(payload: OrderCreate, db: AsyncSession) -> Response:
+    if order_batcher is not None:
+        # validate on the request session, insert together with concurrent orders
+        values, amount, symbol = await _order_values(payload, db)
+        # don't hold the read transaction (and its connection) while waiting
+        await db.rollback()
+        order = await order_batcher.insert(values)
+    else:
+        order, amount, symbol = await run_write(db, lambda s: _insert_order(payload, s))
+    mark_written(("users", order.buyer_user_id), ("shops", order.shop_id), ("orders", order.id))
+
+    payment = PaymentInstructions(
+        to_address=SLH_TOKEN_ADDRESS
+        if payload.payment_method == "slh"
+        else "0xYourBNBMerchantAddress",
+        amount=amount,
+        symbol=symbol,
+        chain_id=BSC_CHAIN_ID,
+    )
+
+    return order_with_payment_out.response({"order": order, "payment_instructions": payment})
+
+
+async def _insert_order(payload: OrderCreate, db: AsyncSession):
+    """
+    Validates and inserts one order; returns (order, amount, symbol).
+    """
+    values, amount, symbol = await _order_values(payload, db)
+
+    # statement 2: INSERT ... RETURNING, no refresh round trip
+    order = await db.scalar(insert(OrderModel).values(**values).returning(OrderModel))
+    return order, amount, symbol
+
+
+async def _order_values(payload: OrderCreate, db: AsyncSession):
+    """
+    Validates the request; returns (order column values, amount, symbol).
+    """
+    # statement 1: validate buyer, shop and item together
+    item = (await db.execute(order_validation_query(payload))).one()
+
+    if item.buyer_id is None:
+        raise HTTPException(status_code=400, detail="Buyer user not found")
+    if item.shop_id is None:
+        raise HTTPException(status_code=400, detail="Shop not found")
+    if item.item_id is None:
         raise HTTPException(status_code=400, detail="Item not found")
+    if item.item_shop_id != payload.shop_id:
+        raise HTTPException(status_code=400, detail="Item does not belong to shop")
 
     amount_slh: Optional[str] = None
     amount_bnb: Optional[str] = None
@@ -538,65 +796,53 @@ def create_order(payload: OrderCreate, db: Session = Depends(get_db)) -> OrderWi
         amount_bnb = item.price_bnb
         symbol = "BNB"
 
-    order = OrderModel(
-        buyer_user_id=buyer.id,
-        shop_id=shop.id,
-        item_id=item.id,
-        amount_slh=amount_slh,
-        amount_bnb=amount_bnb,
-        status="pending",
-    )
-    db.add(order)
-    db.commit()
-    db.refresh(order)
-
-    payment = PaymentInstructions(
-        to_address=SLH_TOKEN_ADDRESS
-        if payload.payment_method == "slh"
-        else "0xYourBNBMerchantAddress",
-        amount=amount_slh or amount_bnb or "0",
-        symbol=symbol,
-        chain_id=BSC_CHAIN_ID,
-    )
-
-    return OrderWithPayment(
-        order=Order(
-            id=order.id,
-            buyer_user_id=order.buyer_user_id,
-            shop_id=order.shop_id,
-            item_id=order.item_id,
-            amount_slh=order.amount_slh,
-            amount_bnb=order.amount_bnb,
-            status=order.status,
-            tx_hash=order.tx_hash,
-            created_at=order.created_at.isoformat(),
-            updated_at=order.updated_at.isoformat(),
-        ),
-        payment_instructions=payment,
-    )
+    values = {
+        "buyer_user_id": payload.buyer_user_id,
+        "shop_id": payload.shop_id,
+        "item_id": payload.item_id,
+        "amount_slh": amount_slh,
+        "amount_bnb": amount_bnb,
+        "status": "pending",
+    }
+    return values, amount_slh or amount_bnb or "0", symbol
 
 
 @app.get("/orders/{order_id}", response_model=Order)
-def get_order(order_id: str, db: Session = Depends(get_db)) -> Order:
-    order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
+async def get_order(order_id: str, db: AsyncSession = Depends(get_read_db)) -> Response:
+    order = await db.get(OrderModel, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    return Order(
-        id=order.id,
-        buyer_user_id=order.buyer_user_id,
-        shop_id=order.shop_id,
-        item_id=order.item_id,
-        amount_slh=order.amount_slh,
-        amount_bnb=order.amount_bnb,
-        status=order.status,
-        tx_hash=order.tx_hash,
-        created_at=order.created_at.isoformat(),
-        updated_at=order.updated_at.isoformat(),
-    )
+    return order_out.response(order)
+
+
+@app.get("/orders", response_model=Lookup[OrderExpanded])
+async def lookup_orders(
+    ids: List[str] = Depends(ids_query),
+    expand: List[str] = Depends(order_expand_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return await _lookup_orders(db, ids, expand)
+
+
+@app.post("/orders:lookup", response_model=Lookup[OrderExpanded])
+async def lookup_orders_post(
+    payload: LookupRequest,
+    expand: List[str] = Depends(order_expand_query),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    return await _lookup_orders(db, unique_ids(payload.ids), expand)
+
+
+async def _lookup_orders(db: AsyncSession, ids: List[str], expand: List[str]) -> Response:
+    if not expand:
+        return order_lookup_out.response(await lookup(db, OrderModel, ids))
+
+    result = await lookup(db, OrderModel, ids, expanded_orders_select(expand))
+    orders = embed_summaries(result["items"].values(), expand)
+    result["items"] = {order["id"]: order for order in orders}
+    return order_expanded_lookup_out.response(result)
 
-from .demo_order_bot_manual import router as demo_order_bot_router
-app.include_router(demo_order_bot_router)
 
 
 
@@ -0,0 +1,237 @@
+"""
+Versioned schema migrations.
+
+Applies migrations/NNNN_name.sql and migrations/NNNN_name.py in order and
+records every applied version in the schema_migrations table.
+
+  python -m api.migrate            # apply pending migrations
+  python -m api.migrate --status   # list applied / pending
+
+SQL files:
+  - statements separated by ';'
+  - optional header lines:
+      -- dialect: postgresql      (skipped on other dialects, and not recorded
+                                   there, so it runs if the database moves)
+      -- transaction: off         (run in autocommit, e.g. CREATE INDEX CONCURRENTLY)
+
+Python files define `upgrade(conn)` and may set `TRANSACTIONAL = False`.
+
+Migrations must be idempotent (IF NOT EXISTS, or inspect the existing
+columns): 0001 creates the frozen baseline schema, and every change since
+then is a later migration that may find its change already there on a
+database created by create_all. Keep them dialect-portable where possible.
+
+Only one process migrates at a time: a pg_advisory_lock on Postgres, a lock
+file next to the database file on SQLite (AUTO_MIGRATE runs in every worker).
+"""
+
+import contextlib
+import importlib.util
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger("slh_migrate")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+VERSION_TABLE = "schema_migrations"
+
+# key for pg_advisory_lock, so several workers starting together don't race
+ADVISORY_LOCK_KEY = 72_001_007
+
+
+class Migration:
+    def __init__(self, path: Path):
+        self.path = path
+        self.version = path.stem
+        self.dialect = None
+        self.transactional = True
+        self._module = None
+        self._statements: List[str] = []
+
+        if path.suffix == ".sql":
+            self._load_sql()
+        else:
+            self._load_py()
+
+    def _load_sql(self) -> None:
+        sql = self.path.read_text(encoding="utf-8-sig")
+        for line in sql.splitlines():
+            line = line.strip()
+            if not line.startswith("--"):
+                continue
+            key, _, value = line[2:].partition(":")
+            key, value = key.strip().lower(), value.strip().lower()
+            if key == "dialect":
+                self.dialect = value
+            elif key == "transaction" and value == "off":
+                self.transactional = False
+        self._statements = [s.strip() for s in sql.split(";") if _has_sql(s)]
+
+    def _load_py(self) -> None:
+        spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self._module = module
+        self.dialect = getattr(module, "DIALECT", None)
+        self.transactional = getattr(module, "TRANSACTIONAL", True)
+
+    def applies_to(self, dialect_name: str) -> bool:
+        return self.dialect is None or self.dialect == dialect_name
+
+    def run(self, conn: Connection) -> None:
+        if self._module is not None:
+            self._module.upgrade(conn)
+            return
+        for statement in self._statements:
+            conn.exec_driver_sql(statement)
+
+
+def _has_sql(chunk: str) -> bool:
+    return any(
+        line.strip() and not line.strip().startswith("--")
+        for line in chunk.splitlines()
+    )
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    paths = [
+        p
+        for p in directory.iterdir()
+        if p.suffix in (".sql", ".py") and p.stem[:4].isdigit()
+    ]
+    return [Migration(p) for p in sorted(paths, key=lambda p: p.stem)]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            "version VARCHAR(255) PRIMARY KEY, "
+            "applied_at TIMESTAMP NOT NULL)"
+        )
+    )
+
+
+def applied_versions(conn: Connection) -> Set[str]:
+    rows = conn.execute(text(f"SELECT version FROM {VERSION_TABLE}"))
+    return {r[0] for r in rows}
+
+
+def _record(conn: Connection, version: str) -> None:
+    conn.execute(
+        text(f"INSERT INTO {VERSION_TABLE} (version, applied_at) VALUES (:v, :at)"),
+        {"v": version, "at": datetime.utcnow()},
+    )
+
+
+def run_migrations(engine: Engine, directory: Path = MIGRATIONS_DIR) -> List[str]:
+    """
+    Applies every pending migration; returns the versions applied now.
+    """
+    dialect = engine.dialect.name
+    applied_now: List[str] = []
+
+    with migration_lock(engine):
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            done = applied_versions(conn)
+
+        for migration in discover(directory):
+            if migration.version in done:
+                continue
+
+            if not migration.applies_to(dialect):
+                logger.info("Skipping %s (dialect %s)", migration.version, migration.dialect)
+                continue
+            if migration.transactional:
+                logger.info("Applying %s", migration.version)
+                with engine.begin() as conn:
+                    migration.run(conn)
+            else:
+                logger.info("Applying %s (autocommit)", migration.version)
+                with engine.connect() as conn:
+                    migration.run(conn.execution_options(isolation_level="AUTOCOMMIT"))
+
+            with engine.begin() as conn:
+                _record(conn, migration.version)
+            applied_now.append(migration.version)
+
+    return applied_now
+
+
+@contextlib.contextmanager
+def migration_lock(engine: Engine) -> Iterator[None]:
+    """
+    Held for the whole run, so workers starting together migrate one at a
+    time; the others wait and then find nothing pending.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+                conn.commit()
+    elif engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        with _file_lock(Path(f"{engine.url.database}.migrate.lock")):
+            yield
+    else:
+        yield
+
+
+@contextlib.contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def main(argv: List[str]) -> None:
+    from .db import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    if "--status" in argv:
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            done = applied_versions(conn)
+        for migration in discover():
+            if migration.version in done:
+                state = "applied"
+            elif not migration.applies_to(engine.dialect.name):
+                state = f"skipped (dialect {migration.dialect})"
+            else:
+                state = "pending"
+            print(f"{migration.version:40} {state}")
+        return
+
+    applied = run_migrations(engine)
+    print(f"Applied {len(applied)} migration(s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
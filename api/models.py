@@ -1,7 +1,7 @@
 ﻿from datetime import datetime
 import uuid
 
-from sqlalchemy import BigInteger, Column, String, Integer, Float, DateTime, ForeignKey, Text
+from sqlalchemy import BigInteger, Column, String, Integer, Float, DateTime, ForeignKey, Index, LargeBinary, Text
 from sqlalchemy.orm import relationship
 
 from .db import Base
@@ -35,6 +35,9 @@ class User(Base):
 
 class Shop(Base):
     __tablename__ = "shops"
+    __table_args__ = (
+        Index("ix_shops_owner_created", "owner_user_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     owner_user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -55,6 +58,9 @@ class Shop(Base):
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        Index("ix_items_shop_created", "shop_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     shop_id = Column(String, ForeignKey("shops.id"), nullable=False)
@@ -78,6 +84,10 @@ class Item(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_buyer_created", "buyer_user_id", "created_at", "id"),
+        Index("ix_orders_shop_created", "shop_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     buyer_user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -88,6 +98,8 @@ class Order(Base):
     amount_bnb = Column(String, nullable=True)
     status = Column(String, nullable=False, default="pending")
     tx_hash = Column(String, nullable=True)
+    payment_proof_url = Column(String, nullable=True)
+    payment_proof_file_unique_id = Column(String, nullable=True)
 
     created_at = Column(DateTime, default=now_dt, nullable=False)
     updated_at = Column(DateTime, default=now_dt, nullable=False)
@@ -97,3 +109,14 @@ class Order(Base):
     item = relationship("Item", back_populates="orders")
 
 
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(64), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request with this key is still running
+    status_code = Column(Integer, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    media_type = Column(String(255), nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
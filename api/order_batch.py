@@ -0,0 +1,103 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+
+from .db import open_session, run_write
+from .models import Order as OrderModel
+
+# opt-in: collect order inserts for a few ms and write them together
+ORDER_BATCH = os.getenv("ORDER_BATCH", "0").lower() in ("1", "true", "yes")
+ORDER_BATCH_WINDOW_MS = float(os.getenv("ORDER_BATCH_WINDOW_MS", "5"))
+ORDER_BATCH_MAX = int(os.getenv("ORDER_BATCH_MAX", "200"))
+
+
+class OrderBatcher:
+    """
+    Group commit for order inserts.
+
+    Callers hand in the column values of one (already validated) order and
+    await their own future. Everything that arrives within the window (or
+    until max_batch rows) is written as one multi-row INSERT ... RETURNING
+    in a single transaction, so N orders cost one round trip and one commit.
+
+    If the batch fails (e.g. one row violates a constraint), its rows are
+    retried one by one, so each caller gets its own order or its own error.
+    """
+
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.orders = 0
+        self.fallbacks = 0
+
+    async def insert(self, values: Dict[str, Any]) -> OrderModel:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((values, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+        return await future
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._flush(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        try:
+            orders = await self._write([values for values, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                future = batch[0][1]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            self.fallbacks += 1
+            await asyncio.gather(*(self._flush([entry]) for entry in batch))
+            return
+
+        self.batches += 1
+        self.orders += len(batch)
+        for (_, future), order in zip(batch, orders):
+            if not future.done():
+                future.set_result(order)
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> List[OrderModel]:
+        async def insert_rows(session) -> List[OrderModel]:
+            result = await session.scalars(
+                insert(OrderModel).returning(OrderModel, sort_by_parameter_order=True),
+                rows,
+            )
+            return result.all()
+
+        session = open_session()
+        try:
+            return await run_write(session, insert_rows)
+        finally:
+            await session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "orders": self.orders,
+            "fallbacks": self.fallbacks,
+            "avg_batch": round(self.orders / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+order_batcher = (
+    OrderBatcher(ORDER_BATCH_WINDOW_MS / 1000, ORDER_BATCH_MAX) if ORDER_BATCH else None
+)
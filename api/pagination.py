@@ -0,0 +1,82 @@
+import base64
+from datetime import datetime
+from typing import Generic, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import tuple_
+
+T = TypeVar("T")
+
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 500
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+class PageParams:
+    """
+    Query params shared by every list endpoint:
+      - limit: page size
+      - cursor: next_cursor from the previous page
+      - unpaginated: explicit opt-in to get every row in one response
+    """
+
+    def __init__(
+        self,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None),
+        unpaginated: bool = Query(False),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.unpaginated = unpaginated
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(
+    db, stmt, model, params: PageParams, columns: bool = False
+) -> Tuple[list, Optional[str]]:
+    """
+    Keyset pagination on (created_at, id): stable ordering, and every page
+    is an index range scan no matter how deep the client scrolls.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+
+    columns=True: stmt selects plain columns (including created_at and id),
+    and the rows come back as Row objects instead of ORM instances.
+    """
+    fetch = db.execute if columns else db.scalars
+    stmt = stmt.order_by(model.created_at, model.id)
+    if params.unpaginated:
+        return (await fetch(stmt)).all(), None
+
+    if params.cursor:
+        created_at, row_id = decode_cursor(params.cursor)
+        stmt = stmt.where(
+            tuple_(model.created_at, model.id) > tuple_(created_at, row_id)
+        )
+
+    # one extra row tells us whether there is a next page
+    rows = (await fetch(stmt.limit(params.limit + 1))).all()
+    if len(rows) <= params.limit:
+        return rows, None
+
+    rows = rows[: params.limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
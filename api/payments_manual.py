@@ -1,88 +1,199 @@
 import os
-import uuid
+from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from starlette.requests import Request
 from starlette.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .db import get_db
+from .db import get_async_db, get_read_db, mark_written, run_write
+from .models import Order as OrderModel
+from .proof_storage import PROOF_MAX_BYTES, ProofTooLarge, proof_storage
+from .upload_stream import StreamingForm
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
-UPLOAD_DIR = "uploaded_proofs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+@router.get("/proof-status")
+async def payment_proof_status(
+    order_id: str = Query(...),
+    file_unique_id: str = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Cheap "already have this proof" check for the bot: one primary key
+    lookup, no file transfer. When the order's proof has the same Telegram
+    file_unique_id, the bot answers the user without downloading or
+    uploading the photo again.
+    """
+    order = await db.get(OrderModel, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    stored_unique_id = order.payment_proof_file_unique_id
+    return JSONResponse(
+        {
+            "ok": True,
+            "order_id": order_id,
+            "duplicate": stored_unique_id is not None and stored_unique_id == file_unique_id,
+            "proof_url": order.payment_proof_url,
+        }
+    )
+
+
+# room for the multipart framing and text fields around the file itself
+UPLOAD_FORM_OVERHEAD = 16 * 1024
+
+UPLOAD_PROOF_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "order_id": {
+                            "type": "string",
+                            "description": "If not given as a query parameter",
+                        },
+                        "file_unique_id": {"type": "string"},
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
 
-@router.post("/upload-proof")
+
+@router.post("/upload-proof", openapi_extra=UPLOAD_PROOF_FORM)
 async def upload_payment_proof(
-    order_id: str = Form(...),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    request: Request,
+    order_id: Optional[str] = Query(None, description="Checked before the upload is read"),
+    file_unique_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Accepts: order_id + image file (bank transfer receipt) from the bot.
-    Saves the file into uploaded_proofs/, and updates public."orders":
+    Accepts: order_id + image file (bank transfer receipt) from the bot,
+    plus the Telegram file_unique_id of the photo when the bot has it.
+    Streams the file into the proof storage (content-addressed, so a resent
+    receipt is stored once), and updates the order:
       - payment_proof_url = file path
+      - payment_proof_file_unique_id = Telegram file_unique_id
       - status = 'waiting_verification'
-      - updated_at = NOW()
+      - updated_at = now
+
+    The form is parsed off the request stream (see upload_stream.py), not
+    with request.form(): an oversized Content-Length is rejected before the
+    body is read. order_id / file_unique_id can be query parameters (the
+    bot sends them that way: the order is checked before any of the body is
+    read) or form fields, in any order. A file that arrives before its
+    order_id is only staged, and stored once the order has been checked.
+
+    Storage writes run in the threadpool and the order update goes through
+    run_write (the single writer in the SQLite profile), so a slow disk or
+    DB round trip never blocks the event loop.
     """
 
-    # basic validation
-    if not file or not file.filename:
+    # size is known up front when the client sent it
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and (
+        int(content_length) > PROOF_MAX_BYTES + UPLOAD_FORM_OVERHEAD
+    ):
+        raise HTTPException(status_code=413, detail="Proof file too large")
+
+    form = StreamingForm(request)
+
+    # check the order as early as we know it: before reading the body when
+    # it came in the query, else once the fields before the file are in
+    order = await _get_order(db, order_id) if order_id else None
+    has_file = await form.read_until_file()
+    if not has_file or not form.filename:
         raise HTTPException(status_code=400, detail="No file uploaded")
 
-    # unique file name
-    ext = os.path.splitext(file.filename)[1] or ".jpg"
-    filename = f"{uuid.uuid4()}{ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+    order_id = order_id or form.fields.get("order_id")
+    file_unique_id = file_unique_id or form.fields.get("file_unique_id") or None
+    if order is None and order_id:
+        order = await _get_order(db, order_id)
 
-    # save file to disk
-    contents = await file.read()
-    with open(filepath, "wb") as f:
-        f.write(contents)
+    # same Telegram photo already attached -> nothing to store or update
+    if order is not None and _is_duplicate(order, file_unique_id):
+        return _duplicate_response(order)
+
+    # don't hold the read transaction (and its connection) while the file streams
+    await db.rollback()
+
+    # stream file into a temp file (key = sha256 of the content)
+    ext = os.path.splitext(form.filename)[1] or ".jpg"
+    try:
+        staged = await proof_storage.stage(form.file_chunks(), ext)
+    except ProofTooLarge:
+        raise HTTPException(status_code=413, detail="Proof file too large")
+
+    try:
+        # fields sent after the file
+        await form.read_rest()
+        order_id = order_id or form.fields.get("order_id")
+        file_unique_id = file_unique_id or form.fields.get("file_unique_id") or None
+        if not order_id:
+            raise HTTPException(status_code=400, detail="order_id is required")
+        if order is None:
+            order = await _get_order(db, order_id)
+            if _is_duplicate(order, file_unique_id):
+                return _duplicate_response(order)
+            await db.rollback()
+
+        key = await proof_storage.commit(staged)
+    finally:
+        await proof_storage.discard(staged)
 
     # logical URL for internal reference
-    file_url = f"/{UPLOAD_DIR}/{filename}"
-
-    # check order exists
-    row = db.execute(
-        text('SELECT id FROM public."orders" WHERE id = :oid'),
-        {"oid": order_id},
-    ).fetchone()
-
-    if not row:
-        # cleanup if order not found
-        try:
-            os.remove(filepath)
-        except OSError:
-            pass
-        raise HTTPException(status_code=404, detail="Order not found")
+    file_url = proof_storage.url_for(key)
 
-    # update order with proof + status
-    db.execute(
-        text(
-            '''
-            UPDATE public."orders"
-            SET
-                payment_proof_url = :url,
-                status = :status,
-                updated_at = NOW()
-            WHERE id = :oid
-            '''
-        ),
-        {
-            "url": file_url,
-            "status": "waiting_verification",
-            "oid": order_id,
-        },
+    # update order with proof + status (single writer in the SQLite profile)
+    stmt = (
+        update(OrderModel)
+        .where(OrderModel.id == order_id)
+        .values(
+            payment_proof_url=file_url,
+            payment_proof_file_unique_id=file_unique_id,
+            status="waiting_verification",
+            updated_at=datetime.utcnow(),
+        )
     )
-    db.commit()
+    await run_write(db, lambda s: s.execute(stmt))
+    mark_written(("orders", order_id))
 
     return JSONResponse(
         {
             "ok": True,
             "order_id": order_id,
             "proof_url": file_url,
+            "duplicate": False,
+        }
+    )
+
+
+async def _get_order(db: AsyncSession, order_id: str) -> OrderModel:
+    order = await db.get(OrderModel, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+def _is_duplicate(order: OrderModel, file_unique_id: Optional[str]) -> bool:
+    return file_unique_id is not None and order.payment_proof_file_unique_id == file_unique_id
+
+
+def _duplicate_response(order: OrderModel) -> JSONResponse:
+    return JSONResponse(
+        {
+            "ok": True,
+            "order_id": order.id,
+            "proof_url": order.payment_proof_url,
+            "duplicate": True,
         }
     )
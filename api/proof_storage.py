@@ -0,0 +1,249 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import RedirectResponse, Response
+from starlette.routing import Route
+from starlette.staticfiles import StaticFiles
+
+# which backend stores the payment proofs: "local" or "s3"
+PROOF_STORAGE = os.getenv("PROOF_STORAGE", "local").lower()
+PROOF_STORAGE_DIR = os.getenv(
+    "PROOF_STORAGE_DIR",
+    str(Path(__file__).resolve().parent.parent / "uploaded_proofs"),
+)
+# uploads in progress; outside the served directory, so a partial or
+# rejected upload can never be fetched. Keep it on the same filesystem as
+# PROOF_STORAGE_DIR (the default is next to it): finished files are renamed.
+PROOF_STORAGE_TMP_DIR = os.getenv(
+    "PROOF_STORAGE_TMP_DIR",
+    f"{PROOF_STORAGE_DIR.rstrip(os.sep)}.incoming",
+)
+
+# S3 / MinIO settings (credentials come from the usual AWS_* variables)
+PROOF_S3_BUCKET = os.getenv("PROOF_S3_BUCKET", "slh-payment-proofs")
+PROOF_S3_ENDPOINT_URL = os.getenv("PROOF_S3_ENDPOINT_URL")  # e.g. http://minio:9000
+PROOF_S3_PREFIX = os.getenv("PROOF_S3_PREFIX", "")
+PROOF_S3_URL_TTL = int(os.getenv("PROOF_S3_URL_TTL", "3600"))
+
+# upload limits (bytes); PROOF_CHUNK_SIZE = size of the buffered disk writes
+PROOF_MAX_BYTES = int(os.getenv("PROOF_MAX_BYTES", str(10 * 1024 * 1024)))
+PROOF_CHUNK_SIZE = int(os.getenv("PROOF_CHUNK_SIZE", str(64 * 1024)))
+
+# URL prefix the stored proofs are served under (see main.py)
+PROOF_URL_PREFIX = "/uploaded_proofs"
+
+
+class ProofTooLarge(Exception):
+    pass
+
+
+def shard_key(digest: str, ext: str) -> str:
+    """
+    ab/cd/abcd...ef.jpg – two levels of 256 directories keep every
+    directory small no matter how many proofs we store.
+    """
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class StagedProof:
+    """
+    An upload hashed into a temp file, not stored yet (see ProofStorage.stage).
+    """
+
+    def __init__(self, tmp_path: str, key: str):
+        self.tmp_path = tmp_path
+        self.key = key
+
+
+class ProofStorage(ABC):
+    """
+    Content-addressed storage for payment proofs.
+
+    `stage()` streams the upload chunks to a temp file while hashing them
+    (SHA-256); `commit()` hands the temp file to the backend under a sharded
+    key derived from the hash. Identical proofs end up under the same key,
+    so a resent screenshot is stored once. `save()` does both.
+    """
+
+    tmp_dir: Optional[str] = None
+
+    async def save(self, chunks: AsyncIterator[bytes], ext: str) -> str:
+        """
+        Stores the uploaded bytes and returns their key.
+        Raises ProofTooLarge once more than PROOF_MAX_BYTES were read, without
+        reading the rest.
+        """
+        staged = await self.stage(chunks, ext)
+        try:
+            return await self.commit(staged)
+        finally:
+            await self.discard(staged)
+
+    async def stage(self, chunks: AsyncIterator[bytes], ext: str) -> StagedProof:
+        """
+        Reads the upload into a temp file; nothing is stored until commit().
+        The caller must discard() it either way. Raises ProofTooLarge like save().
+        """
+        fd, tmp_path = await run_in_threadpool(
+            tempfile.mkstemp, ".part", None, self.tmp_dir
+        )
+        out = os.fdopen(fd, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            # network chunks can be small: one threadpool write per PROOF_CHUNK_SIZE
+            pending = bytearray()
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > PROOF_MAX_BYTES:
+                    raise ProofTooLarge()
+                digest.update(chunk)
+                pending += chunk
+                if len(pending) >= PROOF_CHUNK_SIZE:
+                    await run_in_threadpool(out.write, bytes(pending))
+                    pending.clear()
+            if pending:
+                await run_in_threadpool(out.write, bytes(pending))
+            await run_in_threadpool(out.close)
+        except BaseException:
+            if not out.closed:
+                await run_in_threadpool(out.close)
+            await run_in_threadpool(_remove_file, tmp_path)
+            raise
+        return StagedProof(tmp_path, shard_key(digest.hexdigest(), ext.lower()))
+
+    async def commit(self, staged: StagedProof) -> str:
+        """
+        Stores a staged upload under its key and returns the key.
+        """
+        await run_in_threadpool(self._store, staged.tmp_path, staged.key)
+        return staged.key
+
+    async def discard(self, staged: StagedProof) -> None:
+        """
+        Removes the temp file (already gone if _store moved it).
+        """
+        await run_in_threadpool(_remove_file, staged.tmp_path)
+
+    def url_for(self, key: str) -> str:
+        return f"{PROOF_URL_PREFIX}/{key}"
+
+    @abstractmethod
+    def _store(self, tmp_path: str, key: str) -> None:
+        """
+        Moves/copies the finished temp file under `key`; keeps the existing
+        object if the key is already there. Runs in the threadpool.
+        """
+
+    @abstractmethod
+    def asgi_app(self):
+        """
+        ASGI app mounted at PROOF_URL_PREFIX to serve stored proofs.
+        """
+
+
+class LocalProofStorage(ProofStorage):
+    def __init__(self, root: str, tmp_dir: str):
+        self.root = Path(root)
+        self.tmp_dir = tmp_dir
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _store(self, tmp_path: str, key: str) -> None:
+        path = self.root / key
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # atomic when the temp dir is on the same filesystem as root
+            os.replace(tmp_path, path)
+        except OSError:
+            # another filesystem: copy under a hidden name, then rename
+            partial = path.with_name(f".{path.name}.part")
+            shutil.copyfile(tmp_path, partial)
+            os.replace(partial, path)
+
+    def asgi_app(self):
+        return StaticFiles(directory=str(self.root))
+
+
+class S3ProofStorage(ProofStorage):
+    """
+    Any S3-compatible store (AWS S3, or MinIO locally via
+    PROOF_S3_ENDPOINT_URL). Proofs are served through short-lived
+    presigned URLs.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError(
+                "PROOF_STORAGE=s3 requires boto3 (see the optional line in api/requirements.txt)"
+            ) from e
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def _store(self, tmp_path: str, key: str) -> None:
+        if self._exists(key):
+            return
+        self.client.upload_file(tmp_path, self.bucket, self._object_key(key))
+
+    def asgi_app(self):
+        async def serve(request):
+            key = request.path_params["key"]
+            if not key:
+                return Response(status_code=404)
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+                ExpiresIn=PROOF_S3_URL_TTL,
+            )
+            return RedirectResponse(url, status_code=307)
+
+        return Starlette(routes=[Route("/{key:path}", serve)])
+
+
+def build_proof_storage() -> ProofStorage:
+    if PROOF_STORAGE == "s3":
+        return S3ProofStorage(
+            bucket=PROOF_S3_BUCKET,
+            endpoint_url=PROOF_S3_ENDPOINT_URL,
+            prefix=PROOF_S3_PREFIX,
+        )
+    if PROOF_STORAGE == "local":
+        return LocalProofStorage(PROOF_STORAGE_DIR, PROOF_STORAGE_TMP_DIR)
+    raise RuntimeError(f"Unknown PROOF_STORAGE: {PROOF_STORAGE}")
+
+
+proof_storage = build_proof_storage()
@@ -0,0 +1,53 @@
+import json
+from typing import Any, Dict, Generic, Type, TypeVar
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+T = TypeVar("T")
+
+
+def parse_metadata_json(value: Any) -> Dict[str, Any]:
+    """
+    Item.metadata_json is stored as a JSON string; response models accept
+    either that string or an already-parsed dict.
+    """
+    if value is None or value == "":
+        return {}
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+class Serializer(Generic[T]):
+    """
+    ORM rows -> JSON in one pass.
+
+    Validates with `from_attributes` straight off the ORM objects (lists go
+    through the same TypeAdapter), and returns an ORJSONResponse. Returning a
+    Response from a route makes FastAPI skip the response_model
+    re-validation + jsonable_encoder pass over data we just built.
+    """
+
+    def __init__(self, tp: Type[T]):
+        self.adapter = TypeAdapter(tp)
+
+    def validate(self, obj: Any) -> T:
+        return self.adapter.validate_python(obj, from_attributes=True)
+
+    def dump(self, obj: Any) -> Any:
+        """
+        Plain python data (datetimes kept as-is, orjson renders them).
+        """
+        return self.adapter.dump_python(self.validate(obj))
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Serialized JSON body, e.g. for the response caches.
+        """
+        return orjson.dumps(self.dump(obj), option=orjson.OPT_NON_STR_KEYS)
+
+    def response(self, obj: Any, status_code: int = 200) -> ORJSONResponse:
+        return ORJSONResponse(self.dump(obj), status_code=status_code)
+
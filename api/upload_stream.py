@@ -0,0 +1,156 @@
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # older python-multipart releases
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# text fields (order_id, file_unique_id) are tiny; anything bigger is not ours
+FORM_FIELD_MAX_BYTES = 1024
+
+
+class StreamingForm:
+    """
+    multipart/form-data read straight off request.stream(), instead of
+    request.form() (which receives the whole body and spools the files to
+    disk before the route can look at anything).
+
+    Text fields are collected as they arrive. The file part is handed out
+    as an async iterator of chunks, so the caller can validate the fields
+    that came before it (and reject the request) before reading any of the
+    file, and can stop reading at its own size limit. Fields sent after the
+    file are read by read_rest().
+    """
+
+    def __init__(self, request: Request):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_content_type: Optional[str] = None
+
+        self._stream = request.stream()
+        self._events: Deque[Tuple[str, bytes]] = deque()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part_name = ""
+        self._in_file = False
+        self._field_data = bytearray()
+        self._file_done = False
+        self._body_done = False
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    # ---- parser callbacks (sync, they only queue events) ----
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._field_data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("latin-1")
+        self._in_file = b"filename" in options
+        if self._in_file and self.filename is None:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.file_content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+            self._events.append(("file_start", b""))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._events.append(("data", data[start:end]))
+            return
+        self._field_data += data[start:end]
+        if len(self._field_data) > FORM_FIELD_MAX_BYTES:
+            raise HTTPException(status_code=400, detail=f"Form field {self._part_name} too large")
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._events.append(("file_end", b""))
+        else:
+            self.fields[self._part_name] = self._field_data.decode("utf-8", "replace")
+
+    # ---- reading ----
+
+    async def _pull(self) -> bool:
+        """
+        Feeds the next chunk of the body to the parser; False at the end.
+        """
+        if self._body_done:
+            return False
+        async for chunk in self._stream:
+            if chunk:
+                self._parser.write(chunk)
+                return True
+        self._parser.finalize()
+        self._body_done = True
+        return False
+
+    async def read_until_file(self) -> bool:
+        """
+        Reads the body up to the start of the first file part (its data is
+        not read yet). Fields sent before the file are in self.fields.
+        Returns False if the body has no file part.
+        """
+        while True:
+            while self._events:
+                kind, _ = self._events[0]
+                if kind == "file_start":
+                    self._events.popleft()
+                    return True
+                self._events.popleft()
+            if not await self._pull():
+                return False
+
+    async def file_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Data of the file part, chunk by chunk, as it comes off the wire.
+        """
+        while not self._file_done:
+            while self._events:
+                kind, data = self._events.popleft()
+                if kind == "data":
+                    yield data
+                elif kind == "file_end":
+                    self._file_done = True
+                    return
+            if not await self._pull():
+                raise HTTPException(status_code=400, detail="Upload ended before the file did")
+
+    async def read_rest(self) -> None:
+        """
+        Reads the body after the file part, so fields sent after the file
+        are in self.fields too. Data of any further file part is dropped.
+        """
+        while await self._pull():
+            self._events.clear()
+        self._events.clear()
@@ -0,0 +1,96 @@
+"""
+Shared pieces of the HTTP benchmarks: an API server in a subprocess on a
+fresh database, and seeding through the API itself.
+"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def api_server(env: Dict[str, str], database_url: Optional[str] = None) -> Iterator[str]:
+    """
+    uvicorn api.main:app with env on top of ours; yields its base URL.
+    Without database_url the server gets an empty SQLite file of its own.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        server_env = {
+            **os.environ,
+            "DATABASE_URL": database_url or f"sqlite:///{tmp}/bench.db",
+            "PROOF_STORAGE_DIR": os.path.join(tmp, "proofs"),
+            **env,
+        }
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT,
+            env=server_env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"API server exited with {proc.returncode}")
+                try:
+                    if httpx.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("API server did not start")
+                time.sleep(0.1)
+            yield base_url
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def seed_order_payload(client: httpx.AsyncClient, telegram_id: int = 1) -> Dict[str, str]:
+    """
+    A buyer, a shop and an SLH-priced item; returns the POST /orders body.
+    """
+    user = (await client.post("/users/telegram-sync", json={"telegram_id": telegram_id})).json()
+    shop = (
+        await client.post("/shops", json={"owner_user_id": user["id"], "title": "bench"})
+    ).json()
+    item = (
+        await client.post(f"/shops/{shop['id']}/items", json={"name": "bench", "price_slh": "1"})
+    ).json()
+    return {"buyer_user_id": user["id"], "shop_id": shop["id"], "item_id": item["id"]}
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def latency_summary(values: List[float]) -> str:
+    """
+    Seconds in, "p50 .. p95 .. p99 .. max .." in milliseconds out.
+    """
+    return "  ".join(
+        f"{name} {percentile(values, p) * 1000:7.1f}ms"
+        for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+    )
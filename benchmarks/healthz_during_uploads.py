@@ -0,0 +1,129 @@
+"""
+/healthz latency while payment proofs are being uploaded.
+
+Samples /healthz on its own connection, first on an idle server and then
+while --workers clients upload --size-kb proofs back to back. If the
+upload route blocked the event loop (file writes, DB calls), the second
+set of numbers would grow with the upload size.
+
+    python benchmarks/healthz_during_uploads.py [--workers 8] [--size-kb 2048]
+        [--seconds 5] [--fail-above-ms 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _common import api_server, latency_summary, percentile, seed_order_payload  # noqa: E402
+
+
+class HealthzSampler(threading.Thread):
+    """
+    Probes /healthz from a thread of its own, so the upload clients on the
+    event loop don't delay the probes on our side.
+    """
+
+    def __init__(self, base_url: str, interval: float):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.interval = interval
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        with httpx.Client(base_url=self.base_url) as client:
+            while not self.stopped.is_set():
+                t0 = time.perf_counter()
+                r = client.get("/healthz")
+                self.latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+                self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.latencies
+
+
+async def upload_loop(client: httpx.AsyncClient, orders: asyncio.Queue, proof: bytes, stop, done):
+    while not stop.is_set() and not orders.empty():
+        order_id = orders.get_nowait()
+        r = await client.post(
+            "/payments/upload-proof",
+            data={"order_id": order_id},
+            files={"file": ("proof.jpg", proof, "image/jpeg")},
+        )
+        r.raise_for_status()
+        done.append(len(proof))
+
+
+async def run(base_url: str, args) -> int:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        payload = await seed_order_payload(client)
+        orders: asyncio.Queue = asyncio.Queue()
+        for _ in range(args.orders):
+            r = await client.post("/orders", json=payload)
+            r.raise_for_status()
+            orders.put_nowait(r.json()["order"]["id"])
+
+        sampler = HealthzSampler(base_url, args.interval)
+        sampler.start()
+        await asyncio.sleep(args.seconds)
+        idle = sampler.stop()
+
+        proof = os.urandom(args.size_kb * 1024)
+        uploaded = []
+        stop = asyncio.Event()
+        sampler = HealthzSampler(base_url, args.interval)
+        sampler.start()
+        t0 = time.perf_counter()
+        uploaders = [
+            asyncio.create_task(upload_loop(client, orders, proof, stop, uploaded))
+            for _ in range(args.workers)
+        ]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*uploaders)
+        elapsed = time.perf_counter() - t0
+        busy = sampler.stop()
+
+    print(f"idle             {len(idle):5d} probes  {latency_summary(idle)}")
+    print(f"during uploads   {len(busy):5d} probes  {latency_summary(busy)}")
+    print(
+        f"uploads: {len(uploaded)} x {args.size_kb} KiB by {args.workers} workers,"
+        f" {sum(uploaded) / elapsed / 2**20:.1f} MiB/s"
+    )
+    if orders.empty():
+        print("note: ran out of orders before the time was up, raise --orders")
+
+    if args.fail_above_ms is not None:
+        p99 = percentile(busy, 99) * 1000
+        if p99 > args.fail_above_ms:
+            print(f"FAIL: /healthz p99 {p99:.1f}ms during uploads > {args.fail_above_ms}ms")
+            return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=8, help="concurrent uploaders")
+    parser.add_argument("--size-kb", type=int, default=2048, help="size of every proof")
+    parser.add_argument("--seconds", type=float, default=5, help="length of each phase")
+    parser.add_argument("--orders", type=int, default=2000, help="orders to upload proofs for")
+    parser.add_argument("--interval", type=float, default=0.01, help="pause between probes")
+    parser.add_argument("--database-url", help="default: a fresh SQLite file")
+    parser.add_argument("--fail-above-ms", type=float, help="exit 1 if p99 during uploads is above")
+    args = parser.parse_args()
+
+    with api_server({}, args.database_url) as base_url:
+        sys.exit(asyncio.run(run(base_url, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+POST /orders throughput and latency with per-request commits
+(ORDER_BATCH=0) against group commit (ORDER_BATCH=1, api/order_batch.py).
+
+Each mode gets its own server on a fresh database; --concurrency clients
+then create --orders orders between them.
+
+    python benchmarks/order_batch.py [--orders 2000] [--concurrency 50]
+        [--database-url postgresql://...]
+
+Group commit pays off where a commit is expensive (fsync, a network round
+trip to Postgres); against a local SQLite file in WAL mode the two paths
+are expected to be close.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _common import api_server, latency_summary, seed_order_payload  # noqa: E402
+
+
+async def run(base_url: str, args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        payload = await seed_order_payload(client)
+        for _ in range(args.concurrency):  # warm up connections and pools
+            (await client.post("/orders", json=payload)).raise_for_status()
+
+        latencies = []
+        errors = 0
+        remaining = iter(range(args.orders))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/orders", json=payload)
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+
+        batch = (await client.get("/meta/db")).json()["order_batch"]
+    return latencies, errors, elapsed, batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--window-ms", default="5", help="ORDER_BATCH_WINDOW_MS")
+    parser.add_argument("--db-mode", default="async", choices=("async", "sync"))
+    parser.add_argument(
+        "--database-url",
+        help="default: a fresh SQLite file per mode; a shared database keeps its rows",
+    )
+    args = parser.parse_args()
+
+    for name, batch in (("per-request", "0"), ("batched", "1")):
+        env = {
+            "ORDER_BATCH": batch,
+            "ORDER_BATCH_WINDOW_MS": args.window_ms,
+            "DB_MODE": args.db_mode,
+        }
+        with api_server(env, args.database_url) as base_url:
+            latencies, errors, elapsed, stats = asyncio.run(run(base_url, args))
+        line = (
+            f"{name:<12} {args.orders / elapsed:8.0f} orders/s  {latency_summary(latencies)}"
+            f"  errors {errors}"
+        )
+        if stats:
+            line += f"  avg batch {stats['avg_batch']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Per-row cost of rendering an order list response, before and after the
+serializer layer (api/serializers.py).
+
+  before: hand-built Order models with isoformat() strings, then what
+          FastAPI does with a response_model: dump, re-validate, encode,
+          json.dumps
+  after:  Serializer(Page[Order]).response(), from_attributes + orjson
+
+Rows are transient ORM objects, so no database time is included.
+
+    python benchmarks/serialization.py [--rows 1000 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# importing api.main must not touch a real database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("AUTO_MIGRATE", "0")
+
+from pydantic import BaseModel, TypeAdapter  # noqa: E402
+
+from api.main import order_page_out  # noqa: E402
+from api.models import Order as OrderModel  # noqa: E402
+from api.pagination import Page  # noqa: E402
+
+
+class LegacyOrder(BaseModel):
+    # the response model as it was: datetimes pre-rendered by the route
+    id: str
+    buyer_user_id: str
+    shop_id: str
+    item_id: str
+    amount_slh: Optional[str] = None
+    amount_bnb: Optional[str] = None
+    status: str
+    tx_hash: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+legacy_page = TypeAdapter(Page[LegacyOrder])
+
+
+def make_rows(count: int):
+    start = datetime(2025, 1, 1)
+    return [
+        OrderModel(
+            id=f"order-{i:08d}",
+            buyer_user_id="buyer-1",
+            shop_id=f"shop-{i % 50}",
+            item_id=f"item-{i % 500}",
+            amount_slh="12.5",
+            amount_bnb=None,
+            status="pending",
+            tx_hash=None,
+            created_at=start + timedelta(seconds=i),
+            updated_at=start + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def render_before(rows) -> bytes:
+    items = [
+        LegacyOrder(
+            id=o.id,
+            buyer_user_id=o.buyer_user_id,
+            shop_id=o.shop_id,
+            item_id=o.item_id,
+            amount_slh=o.amount_slh,
+            amount_bnb=o.amount_bnb,
+            status=o.status,
+            tx_hash=o.tx_hash,
+            created_at=o.created_at.isoformat(),
+            updated_at=o.updated_at.isoformat(),
+        )
+        for o in rows
+    ]
+    page = Page[LegacyOrder](items=items, next_cursor=None)
+    # fastapi.routing.serialize_response + JSONResponse.render
+    content = page.model_dump()
+    validated = legacy_page.validate_python(content)
+    data = legacy_page.dump_python(validated, mode="json")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def render_after(rows) -> bytes:
+    return order_page_out.response({"items": rows, "next_cursor": None}).body
+
+
+def best_of(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # same JSON either way
+    sample = make_rows(3)
+    assert json.loads(render_before(sample)) == json.loads(render_after(sample))
+
+    print(f"{'rows':>7} {'before us/row':>14} {'after us/row':>13} {'speedup':>8}")
+    for count in args.rows:
+        rows = make_rows(count)
+        before = best_of(render_before, rows, args.repeat)
+        after = best_of(render_after, rows, args.repeat)
+        print(
+            f"{count:>7} {before / count * 1e6:>14.2f} {after / count * 1e6:>13.2f}"
+            f" {before / after:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,99 @@
-﻿import logging
+﻿import asyncio
+import contextlib
+import hashlib
+import logging
 import os
-from typing import Dict, Any
+import secrets
+import sys
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from typing import AsyncIterator, Awaitable, Dict, Any
 
 import httpx
 from telegram import Update
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     MessageHandler,
     filters,
 )
 
+from bot_resilience import CircuitBreaker, CircuitOpen, ResilientCaller, is_api_unavailable
+
 # ==== הגדרות בסיס ====
 API_BASE = os.getenv("API_BASE", "http://slhshopsystem:8080")
 BOT_TOKEN = os.environ["BOT_TOKEN"]
 
+# ==== הגדרות HTTP מול ה-API ====
+# לקוח אחד משותף (connection pool) לכל הקריאות, נפתח ב-startup ונסגר ב-shutdown
+API_HTTP2 = os.getenv("API_HTTP2", "0").lower() in ("1", "true", "yes")
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "100"))
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE", "20"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+
+# timeout לכל endpoint בנפרד (העלאת קובץ ארוכה יותר מסנכרון משתמש)
+API_TIMEOUTS: Dict[str, httpx.Timeout] = {
+    "telegram_sync": httpx.Timeout(10.0, connect=API_CONNECT_TIMEOUT),
+    "demo_order": httpx.Timeout(10.0, connect=API_CONNECT_TIMEOUT),
+    "resolve_referral": httpx.Timeout(5.0, connect=API_CONNECT_TIMEOUT),
+    "upload_proof": httpx.Timeout(30.0, connect=API_CONNECT_TIMEOUT),
+    "proof_status": httpx.Timeout(5.0, connect=API_CONNECT_TIMEOUT),
+}
+
+# עמידות: retries (רק לקריאות idempotent) ו-circuit breaker מול ה-API
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.2"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "2"))
+API_BREAKER_FAILURES = int(os.getenv("API_BREAKER_FAILURES", "5"))
+API_BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", "30"))
+
+# צילומי אישור שלא עלו כי ה-API לא זמין נשמרים בתור ועולים כשהוא חוזר
+DEFERRED_UPLOAD_QUEUE_SIZE = int(os.getenv("DEFERRED_UPLOAD_QUEUE_SIZE", "1000"))
+DEFERRED_UPLOAD_INTERVAL = float(os.getenv("DEFERRED_UPLOAD_INTERVAL", "15"))
+
+# גודל chunk בהעברת צילום אישור מטלגרם ל-API (לא מחזיקים את כל הקובץ בזיכרון)
+PROOF_STREAM_CHUNK_SIZE = int(os.getenv("PROOF_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+# ==== מצב הרצה ====
+# polling (ברירת מחדל) או webhook  שרת ASGI שטלגרם דוחף אליו עדכונים.
+# במצב webhook אין 409 בין מופעים ואין השהיית polling.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # כתובת ציבורית, למשל https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+
+# כמה מופעים מאחורי bot_dispatcher.py (ניתוב לפי telegram_id) ומה המספר של המופע הזה.
+# עם יותר ממופע אחד ה-dispatcher רושם את ה-webhook, לא המופעים.
+BOT_REPLICA_INDEX = int(os.getenv("BOT_REPLICA_INDEX", "0"))
+BOT_REPLICA_COUNT = int(os.getenv("BOT_REPLICA_COUNT", "1"))
+
+# כמה עדכונים מטופלים במקביל (בין משתמשים שונים; לכל משתמש  אחד אחרי השני)
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+
+# ==== cache לסנכרון משתמשים ====
+# /start חוזר עם אותו פרופיל לא קורא שוב ל-/users/telegram-sync עד שה-TTL פג
+SYNC_CACHE_SIZE = int(os.getenv("SYNC_CACHE_SIZE", "50000"))
+SYNC_CACHE_TTL = float(os.getenv("SYNC_CACHE_TTL", "600"))
+
+# ==== cache לקודי הפניה ====
+# /start shop_<code> בקמפיין: הקוד מאותר ב-API פעם אחת ל-TTL, לא בכל /start.
+# קוד שלא קיים נשמר לזמן קצר יותר (כדי שחנות חדשה תופיע מהר).
+REFERRAL_CACHE_SIZE = int(os.getenv("REFERRAL_CACHE_SIZE", "10000"))
+REFERRAL_CACHE_TTL = float(os.getenv("REFERRAL_CACHE_TTL", "300"))
+REFERRAL_NEGATIVE_TTL = float(os.getenv("REFERRAL_NEGATIVE_TTL", "30"))
+
+# ==== שמירת מצב שיחה (user_data) ====
+# ריק = בזיכרון בלבד (נמחק ב-restart). למשל sqlite:///bot_state.db או postgresql://...
+BOT_PERSISTENCE_URL = os.getenv("BOT_PERSISTENCE_URL", "")
+# כל כמה שניות השינויים נכתבים ל-DB (batch אחד; update_interval של PTB)
+BOT_PERSISTENCE_INTERVAL = float(os.getenv("BOT_PERSISTENCE_INTERVAL", "5"))
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -23,13 +101,235 @@ logging.basicConfig(
 logger = logging.getLogger("slh_bot")
 
 
+# ==== לקוח HTTP משותף ====
+
+def build_api_client() -> httpx.AsyncClient:
+    """
+    בונה את ה-AsyncClient המשותף מול ה-API (keep-alive + HTTP/2 אופציונלי).
+    """
+    limits = httpx.Limits(
+        max_connections=API_MAX_CONNECTIONS,
+        max_keepalive_connections=API_MAX_KEEPALIVE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+    )
+    http2 = API_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("API_HTTP2 is set but 'h2' is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    client = httpx.AsyncClient(
+        base_url=API_BASE,
+        limits=limits,
+        http2=http2,
+        timeout=httpx.Timeout(10.0, connect=API_CONNECT_TIMEOUT),
+    )
+    # הלקוח משותף לכל המשתמשים: לא שומרים cookies (כמו ה-read-your-writes
+    # של ה-API), אחרת כתיבה של משתמש אחד משפיעה על הקריאות של כולם
+    client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return client
+
+
+def get_api_client(context: ContextTypes.DEFAULT_TYPE) -> httpx.AsyncClient:
+    """
+    מחזיר את הלקוח המשותף שנשמר ב-bot_data בזמן ה-startup.
+    """
+    return context.bot_data["api_client"]
+
+
+async def on_startup(application: Application) -> None:
+    """
+    נקרא פעם אחת לפני תחילת קבלת העדכונים.
+    """
+    application.bot_data["api_client"] = build_api_client()
+    deferred_uploads.start(application)
+    logger.info("API client ready (max_connections=%s)", API_MAX_CONNECTIONS)
+
+
+async def on_shutdown(application: Application) -> None:
+    """
+    סוגר את ה-connection pool בסיום הריצה.
+    """
+    await deferred_uploads.stop()
+    client = application.bot_data.pop("api_client", None)
+    if client is not None:
+        await client.aclose()
+    logger.info("Cache stats: %s", cache_stats())
+    logger.info("API stats: %s", api_caller.stats())
+
+
+# ==== cache ====
+
+class TTLCache:
+    """
+    cache חסום בגודל (LRU) עם TTL לכל רשומה, ומונים ל-hit rate.
+    רץ רק מתוך ה-event loop של הבוט, לכן בלי נעילה.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any) -> Any:
+        """
+        מחזיר את הערך, או None אם אין / פג תוקף.
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Any, value: Any, ttl: float | None = None) -> None:
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# telegram_id -> hash של השדות שנשלחו בסנכרון האחרון שהצליח
+sync_cache = TTLCache("telegram_sync", SYNC_CACHE_SIZE, SYNC_CACHE_TTL)
+
+# referral_code -> החנות מה-API, או {} לקוד שלא קיים
+referral_cache = TTLCache("referral_codes", REFERRAL_CACHE_SIZE, REFERRAL_CACHE_TTL)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {cache.name: cache.stats() for cache in (sync_cache, referral_cache)}
+
+
+def sync_profile_hash(
+    telegram_username: str,
+    display_name: str,
+    referral_code: str | None,
+) -> str:
+    raw = "\x1f".join((telegram_username, display_name, referral_code or ""))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# ==== עיבוד עדכונים במקביל ====
+
+def update_user_key(update: object) -> int | None:
+    """
+    מזהה המשתמש (או הצ'אט) שהעדכון שייך לו, None לעדכונים בלי משתמש.
+    """
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    מעבד עד max_concurrent_updates עדכונים במקביל, אבל עדכונים של אותו
+    משתמש רצים לפי סדר ההגעה: תמונה לא תטופל לפני ה-/demo_order שקדם לה.
+
+    asyncio.Lock משחרר ממתינים לפי FIFO, והעדכונים נכנסים לעיבוד לפי
+    הסדר בתור של ה-Application  כך שהסדר לכל משתמש נשמר.
+
+    process_update של PTB (final) לוקח את הסמפור של המחלקה הבסיסית *לפני*
+    do_process_update, כך שעדכון שממתין לתור של המשתמש שלו היה תופס slot,
+    ומשתמש אחד עם הרבה עדכונים היה חוסם את כולם. לכן הסמפור הבסיסי לא
+    מגביל, וההגבלה נעשית כאן: slot נתפס רק אחרי שהגיע תור העדכון אצל המשתמש.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # המחלקה הבסיסית בונה את הסמפור שלה לפי max_concurrent_updates,
+        # לכן הגבול האמיתי מדווח רק אחרי super().__init__
+        self._limit = None
+        super().__init__(sys.maxsize)
+        self._limit = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # user_id -> [lock, מספר עדכונים שממתינים/רצים]
+        self._locks: Dict[int, list] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        if self._limit is None:
+            return super().max_concurrent_updates
+        return self._limit
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_user_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
 # ==== קריאות ל-API ====
 
+api_caller = ResilientCaller(
+    CircuitBreaker(API_BREAKER_FAILURES, API_BREAKER_RESET),
+    max_retries=API_RETRIES,
+    backoff_base=API_BACKOFF_BASE,
+    backoff_max=API_BACKOFF_MAX,
+)
+
+
+def idempotency_headers(update: Update) -> Dict[str, str]:
+    """
+    Idempotency-Key נגזר מ-update_id: ניסיון חוזר או update שטלגרם שולח שוב
+    מקבלים מה-API את אותה תשובה ולא יוצרים רשומה כפולה.
+    """
+    return {"Idempotency-Key": f"tg-{update.update_id}"}
+
+
 async def call_api_telegram_sync(
+    client: httpx.AsyncClient,
     telegram_id: int,
     telegram_username: str,
     display_name: str,
     referral_code: str | None = None,
+    headers: Dict[str, str] | None = None,
 ) -> Dict[str, Any]:
     """
     סנכרון משתמש טלגרם עם ה-API.
@@ -41,46 +341,290 @@ async def call_api_telegram_sync(
         "referral_code": referral_code,
     }
     logger.info("POST %s/users/telegram-sync %s", API_BASE, payload)
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(f"{API_BASE}/users/telegram-sync", json=payload)
-        resp.raise_for_status()
-        return resp.json()
+    # upsert  בטוח לשלוח שוב
+    resp = await api_caller.request(
+        client,
+        "POST",
+        "/users/telegram-sync",
+        idempotent=True,
+        json=payload,
+        headers=headers,
+        timeout=API_TIMEOUTS["telegram_sync"],
+    )
+    resp.raise_for_status()
+    return resp.json()
+
 
+async def call_api_resolve_referral(
+    client: httpx.AsyncClient,
+    referral_code: str,
+) -> Dict[str, Any] | None:
+    """
+    מאתר חנות לפי קוד הפניה דרך /shops/by-referral (ה-API מחזיק cache
+    לקודים קיימים ולקודים שגויים). מחזיר None אם הקוד לא קיים.
+    """
+    resp = await api_caller.request(
+        client,
+        "GET",
+        f"/shops/by-referral/{referral_code}",
+        idempotent=True,
+        timeout=API_TIMEOUTS["resolve_referral"],
+    )
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
 
-async def call_api_demo_order(telegram_id: int) -> Dict[str, Any]:
+
+async def call_api_demo_order(
+    client: httpx.AsyncClient,
+    telegram_id: int,
+    headers: Dict[str, str] | None = None,
+) -> Dict[str, Any]:
     """
     יוצר הזמנת דמו דרך /shops/demo-order-bot (GET עם telegram_id).
     """
     params = {"telegram_id": telegram_id}
     logger.info("USING GET FOR DEMO ORDER")
     logger.info("GET %s/shops/demo-order-bot %s", API_BASE, params)
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(f"{API_BASE}/shops/demo-order-bot", params=params)
-        resp.raise_for_status()
-        return resp.json()
+    # יוצר הזמנה: ניסיון חוזר רק כשיש Idempotency-Key
+    resp = await api_caller.request(
+        client,
+        "GET",
+        "/shops/demo-order-bot",
+        idempotent=headers is not None,
+        params=params,
+        headers=headers,
+        timeout=API_TIMEOUTS["demo_order"],
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def call_api_proof_status(
+    client: httpx.AsyncClient,
+    order_id: str,
+    file_unique_id: str,
+) -> bool:
+    """
+    בודק ב-/payments/proof-status אם הצילום הזה (לפי file_unique_id של טלגרם)
+    כבר מקושר להזמנה. מחזיר False גם כשההזמנה לא קיימת  ההעלאה תדווח על כך.
+    """
+    resp = await api_caller.request(
+        client,
+        "GET",
+        "/payments/proof-status",
+        idempotent=True,
+        params={"order_id": order_id, "file_unique_id": file_unique_id},
+        timeout=API_TIMEOUTS["proof_status"],
+    )
+    if resp.status_code == 404:
+        return False
+    resp.raise_for_status()
+    return bool(resp.json().get("duplicate"))
+
+
+async def multipart_stream(
+    boundary: str,
+    fields: Dict[str, str],
+    file_field: str,
+    filename: str,
+    content_type: str,
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[bytes]:
+    """
+    גוף multipart/form-data כ-stream: השדות, ואחריהם תוכן הקובץ chunk אחרי chunk.
+    """
+    for name, value in fields.items():
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode()
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+class ProofDownloadError(Exception):
+    """
+    ההורדה מטלגרם נכשלה באמצע ההעלאה  תקלה בצד של טלגרם, לא של ה-API,
+    ולכן לא נספרת ב-breaker.
+    """
+
+
+async def _telegram_chunks(download: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in download.aiter_bytes(PROOF_STREAM_CHUNK_SIZE):
+            yield chunk
+    except httpx.HTTPError as e:
+        raise ProofDownloadError(f"Telegram download failed: {type(e).__name__}") from e
 
 
 async def call_api_upload_proof(
+    client: httpx.AsyncClient,
     order_id: str,
-    file_bytes: bytes,
+    file_url: str,
+    file_unique_id: str | None = None,
     content_type: str = "image/jpeg",
 ) -> Dict[str, Any]:
     """
-    מעלה צילום אישור תשלום אל /payments/upload-proof כ-multipart/form-data.
+    מעביר צילום אישור תשלום מטלגרם אל /payments/upload-proof כ-multipart/form-data.
+    ההורדה מטלגרם מוזרמת ישירות לתוך גוף ההעלאה (chunked), כך שבזיכרון
+    יש בכל רגע רק chunk אחד ולא עותק מלא של התמונה.
     """
-    data = {"order_id": order_id}
-    files = {
-        "file": ("payment_proof.jpg", file_bytes, content_type),
-    }
+    boundary = secrets.token_hex(16)
+    # ב-query: ה-API בודק את ההזמנה לפני שהוא קורא את הקובץ
+    params = {"order_id": order_id}
+    if file_unique_id:
+        params["file_unique_id"] = file_unique_id
     logger.info("POST %s/payments/upload-proof (order_id=%s)", API_BASE, order_id)
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(
-            f"{API_BASE}/payments/upload-proof",
-            data=data,
-            files=files,
-        )
-        resp.raise_for_status()
-        return resp.json()
+    # ה-API לא זמין  נכשלים מיד, לפני שמורידים משהו מטלגרם
+    api_caller.breaker.before_call()
+    sent = False
+    try:
+        # file_url כולל את ה-token של הבוט  לא נכנס ללוג
+        async with client.stream("GET", file_url, timeout=API_TIMEOUTS["upload_proof"]) as download:
+            download.raise_for_status()
+            body = multipart_stream(
+                boundary,
+                {},
+                "file",
+                "payment_proof.jpg",
+                content_type,
+                _telegram_chunks(download),
+            )
+            # גוף ה-stream נצרך פעם אחת  בלי retry; כשל נכנס לתור ההעלאות המושהות
+            sent = True
+            resp = await api_caller.request(
+                client,
+                "POST",
+                "/payments/upload-proof",
+                idempotent=False,
+                reserved=True,
+                params=params,
+                content=body,
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+                timeout=API_TIMEOUTS["upload_proof"],
+            )
+    except BaseException:
+        # ההורדה מטלגרם נכשלה לפני הקריאה ל-API: משחררים את ה-breaker בלי לקבוע מצב
+        if not sent:
+            api_caller.breaker.release()
+        raise
+    resp.raise_for_status()
+    return resp.json()
+
+
+# ==== העלאות מושהות ====
+
+class DeferredProofUploads:
+    """
+    תור חסום של צילומי אישור שלא עלו כי ה-API לא זמין.
+    שומרים רק את ה-file_id של טלגרם (לא את התמונה); משימת רקע מנסה כל
+    interval שניות, רק כשה-breaker מאפשר, ומודיעה למשתמש כשהצילום עלה.
+    התור בזיכרון  restart מאבד אותו (המשתמש יכול לשלוח שוב).
+    """
+
+    def __init__(self, maxsize: int, interval: float):
+        self.maxsize = maxsize
+        self.interval = interval
+        # (order_id, file_unique_id) -> job  אותו צילום נכנס פעם אחת
+        self._jobs: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._task: asyncio.Task | None = None
+
+        self.queued = 0
+        self.uploaded = 0
+        self.dropped = 0
+
+    def add(self, chat_id: int, order_id: str, file_id: str, file_unique_id: str) -> bool:
+        key = (order_id, file_unique_id)
+        if key not in self._jobs and len(self._jobs) >= self.maxsize:
+            self.dropped += 1
+            return False
+        if key not in self._jobs:
+            self.queued += 1
+        self._jobs[key] = {
+            "chat_id": chat_id,
+            "order_id": order_id,
+            "file_id": file_id,
+            "file_unique_id": file_unique_id,
+        }
+        return True
+
+    def start(self, application: Application) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(application))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._jobs:
+            logger.warning("%s deferred proof upload(s) were not sent", len(self._jobs))
+
+    async def _run(self, application: Application) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._jobs or not api_caller.breaker.allows_calls:
+                continue
+            try:
+                await self.drain(application)
+            except Exception:
+                logger.exception("Error draining deferred proof uploads")
+
+    async def drain(self, application: Application) -> None:
+        client = application.bot_data["api_client"]
+        while self._jobs:
+            key, job = next(iter(self._jobs.items()))
+            try:
+                file = await application.bot.get_file(job["file_id"])
+                result = await call_api_upload_proof(
+                    client,
+                    order_id=job["order_id"],
+                    file_url=file.file_path,
+                    file_unique_id=job["file_unique_id"],
+                )
+            except Exception as e:
+                if is_api_unavailable(e):
+                    # עדיין לא זמין  נשאר בתור לסבב הבא
+                    return
+                logger.exception("Deferred proof upload failed for order %s", job["order_id"])
+                del self._jobs[key]
+                self.dropped += 1
+                await application.bot.send_message(
+                    job["chat_id"],
+                    f"❌ לא הצלחתי להעביר את צילום האישור להזמנה {job['order_id']}.\n"
+                    "אנא שלח אותו שוב.",
+                )
+                continue
+
+            del self._jobs[key]
+            self.uploaded += 1
+            if result.get("ok"):
+                await application.bot.send_message(
+                    job["chat_id"],
+                    "📸 צילום האישור הועבר לשרת!\n"
+                    f"הזמנה {job['order_id']} עודכנה למצב waiting_verification.",
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._jobs),
+            "queued": self.queued,
+            "uploaded": self.uploaded,
+            "dropped": self.dropped,
+        }
+
+
+deferred_uploads = DeferredProofUploads(DEFERRED_UPLOAD_QUEUE_SIZE, DEFERRED_UPLOAD_INTERVAL)
 
 
 # ==== פקודות בוט ====
@@ -92,21 +636,51 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     user = update.effective_user
     referral_code = None
+    referral_shop = None
+    referral_unknown = False
 
     # /start shop_<referral_code>
     if context.args:
         first_arg = context.args[0]
         if isinstance(first_arg, str) and first_arg.startswith("shop_"):
             referral_code = first_arg.split("shop_", 1)[1]
+
+    if referral_code:
+        cached = referral_cache.get(referral_code)
+        if cached is not None:
+            referral_shop = cached or None
+            referral_unknown = not cached
+        else:
+            try:
+                referral_shop = await call_api_resolve_referral(
+                    get_api_client(context),
+                    referral_code,
+                )
+                referral_unknown = referral_shop is None
+                referral_cache.set(
+                    referral_code,
+                    referral_shop or {},
+                    ttl=REFERRAL_NEGATIVE_TTL if referral_unknown else None,
+                )
+            except Exception:
+                # ה-API לא זמין  שומרים את הקוד כמו שהוא (ולא שומרים ב-cache)
+                logger.exception("Error resolving referral code %s", referral_code)
+        if not referral_unknown:
             context.user_data["referral_code"] = referral_code
 
+    profile = sync_profile_hash(user.username or "", user.full_name, referral_code)
     try:
-        await call_api_telegram_sync(
-            telegram_id=user.id,
-            telegram_username=user.username or "",
-            display_name=user.full_name,
-            referral_code=referral_code,
-        )
+        # אותו פרופיל סונכרן לאחרונה  אין מה לשלוח
+        if sync_cache.get(user.id) != profile:
+            await call_api_telegram_sync(
+                get_api_client(context),
+                telegram_id=user.id,
+                telegram_username=user.username or "",
+                display_name=user.full_name,
+                referral_code=referral_code,
+                headers=idempotency_headers(update),
+            )
+            sync_cache.set(user.id, profile)
     except Exception:
         logger.exception("Error syncing user with API")
         if update.message:
@@ -126,8 +700,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "אחרי יצירת הזמנה, שלח צילום אישור תשלום, ואני אקשר אותו להזמנה האחרונה שלך.\n"
     )
 
-    if referral_code:
+    if referral_unknown:
+        text += f"\n⚠️ קוד ההפניה {referral_code} לא נמצא.\n"
+    elif referral_code:
         text += f"\n🔗 נכנסת דרך קוד הפניה: {referral_code}\n"
+        if referral_shop:
+            text += f"🏪 חנות: {referral_shop.get('title', '')}\n"
 
     if update.message:
         await update.message.reply_text(text)
@@ -171,7 +749,18 @@ async def demo_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
 
     try:
-        data = await call_api_demo_order(user.id)
+        data = await call_api_demo_order(
+            get_api_client(context),
+            user.id,
+            headers=idempotency_headers(update),
+        )
+    except CircuitOpen:
+        if update.message:
+            await update.message.reply_text(
+                "⏳ השרת לא זמין כרגע.\n"
+                "אנא נסה שוב בעוד מספר דקות."
+            )
+        return
     except httpx.HTTPStatusError as e:
         logger.error("HTTP error creating demo order: %s", e)
         if update.message:
@@ -225,6 +814,8 @@ async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     לוגיקה:
     - אם יש כיתוב (caption)  ננסה להשתמש בו כ-order_id.
     - אחרת  ניקח את last_order_id מה-user_data.
+    - אותו צילום שכבר נשלח להזמנה (file_unique_id זהה)  עונים מיד,
+      בלי הורדה מטלגרם ובלי העלאה ל-API.
     """
     message = update.message
     user = update.effective_user
@@ -248,29 +839,65 @@ async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    photo = message.photo[-1]
+    proof = {"order_id": order_id, "file_unique_id": photo.file_unique_id}
+
+    # קודם בזיכרון (user_data), אחר כך בדיקה זולה מול ה-API
+    duplicate = context.user_data.get("last_proof") == proof
+    if not duplicate:
+        try:
+            duplicate = await call_api_proof_status(
+                get_api_client(context),
+                order_id,
+                photo.file_unique_id,
+            )
+        except Exception:
+            # הבדיקה היא רק קיצור דרך  ממשיכים להעלאה רגילה
+            logger.exception("Error checking payment proof status")
+
+    if duplicate:
+        context.user_data["last_proof"] = proof
+        await message.reply_text(
+            "✅ הצילום הזה כבר התקבל עבור הזמנה "
+            f"{order_id}, אין צורך לשלוח אותו שוב.\n"
+            "אימות התשלום יתבצע ידנית."
+        )
+        return
+
     try:
-        processing_msg = await message.reply_text("📥 מוריד את התמונה...")
+        processing_msg = await message.reply_text("📤 מעביר את צילום האישור לשרת...")
 
-        photo = message.photo[-1]
         file = await photo.get_file()
-        file_bytearray = await file.download_as_bytearray()
-        file_bytes = bytes(file_bytearray)
 
-        await processing_msg.edit_text("📤 מעלה את צילום האישור לשרת...")
-
-        result = await call_api_upload_proof(order_id=order_id, file_bytes=file_bytes)
+        # file.file_path הוא ה-URL המלא להורדה; ההורדה מוזרמת ישר להעלאה
+        result = await call_api_upload_proof(
+            get_api_client(context),
+            order_id=order_id,
+            file_url=file.file_path,
+            file_unique_id=photo.file_unique_id,
+        )
 
         await processing_msg.delete()
-    except httpx.HTTPStatusError as e:
-        logger.error("Error uploading payment proof to API: %s", e)
-        await message.reply_text(
-            "❌ שגיאה בשליחת צילום האישור לשרת.\n"
-            "אנא נסה שוב מאוחר יותר."
-        )
-        return
-    except Exception:
-        logger.exception("Unexpected error in photo_handler")
-        await message.reply_text("❌ שגיאה בלתי צפויה בטיפול בתמונה.")
+    except Exception as e:
+        # ה-API לא זמין  הצילום נשמר בתור ויעלה כשהשרת יחזור
+        if is_api_unavailable(e) and deferred_uploads.add(
+            message.chat_id, order_id, photo.file_id, photo.file_unique_id
+        ):
+            logger.warning("API unavailable, deferred proof upload for order %s", order_id)
+            await message.reply_text(
+                "⏳ השרת לא זמין כרגע.\n"
+                "שמרתי את צילום האישור ואעביר אותו אוטומטית כשהשרת יחזור  "
+                "אין צורך לשלוח שוב."
+            )
+        elif isinstance(e, httpx.HTTPStatusError):
+            logger.error("Error uploading payment proof to API: %s", e)
+            await message.reply_text(
+                "❌ שגיאה בשליחת צילום האישור לשרת.\n"
+                "אנא נסה שוב מאוחר יותר."
+            )
+        else:
+            logger.exception("Unexpected error in photo_handler")
+            await message.reply_text("❌ שגיאה בלתי צפויה בטיפול בתמונה.")
         return
 
     if not result.get("ok"):
@@ -278,6 +905,8 @@ async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text(f"❌ שגיאה בשרת: {err}")
         return
 
+    context.user_data["last_proof"] = proof
+
     await message.reply_text(
         "📸 קיבלתי את צילום האישור!\n"
         f"הזמנה {order_id} עודכנה למצב waiting_verification.\n"
@@ -300,13 +929,108 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         pass
 
 
-def main() -> None:
+# ==== webhook (ASGI) ====
+
+def build_webhook_app(application: Application):
     """
-    פונקציית ההרצה הראשית של הבוט.
+    אפליקציית ASGI (Starlette) למצב webhook.
+    ה-endpoint רק מכניס את העדכון לתור ומחזיר 200 מיד; העיבוד עצמו
+    נעשה ע"י ה-Application (במקביל, לפי PerUserUpdateProcessor).
     """
-    logger.info("Bot starting. API_BASE=%s", API_BASE)
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+
+    from bot_dispatcher import shard_for
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    async def telegram_webhook(request: Request) -> Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        update = Update.de_json(data, application.bot)
+        if BOT_REPLICA_COUNT > 1:
+            # ה-user_data של המשתמש נמצא רק במופע שלו  ניתוב שגוי = state חסר
+            shard = shard_for(update_user_key(update), BOT_REPLICA_COUNT)
+            if shard != BOT_REPLICA_INDEX:
+                logger.warning(
+                    "Update %s belongs to replica %s, got it on replica %s",
+                    update.update_id, shard, BOT_REPLICA_INDEX,
+                )
+        await application.update_queue.put(update)
+        return Response(status_code=200)
+
+    async def healthz(request: Request) -> Response:
+        body = {
+            "status": "ok",
+            "mode": "webhook",
+            "caches": cache_stats(),
+            "api": api_caller.stats(),
+            "deferred_uploads": deferred_uploads.stats(),
+        }
+        if application.persistence is not None:
+            body["persistence"] = application.persistence.stats()
+        return JSONResponse(body)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # אותו סדר כמו run_polling: initialize -> post_init -> start
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if WEBHOOK_URL and BOT_REPLICA_COUNT <= 1:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=100,
+            )
+            logger.info("Webhook set: %s%s", WEBHOOK_URL.rstrip("/"), WEBHOOK_PATH)
+        else:
+            logger.info(
+                "Not registering the webhook (replica %s/%s)", BOT_REPLICA_INDEX, BOT_REPLICA_COUNT
+            )
+        try:
+            yield
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]),
+            Route("/healthz", healthz, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def build_application() -> Application:
+    """
+    בונה את ה-Application עם כל ה-handlers (משותף ל-polling ול-webhook).
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if BOT_PERSISTENCE_URL:
+        from bot_persistence import SQLPersistence
+
+        builder = builder.persistence(
+            SQLPersistence(BOT_PERSISTENCE_URL, update_interval=BOT_PERSISTENCE_INTERVAL)
+        )
+    application = builder.build()
 
     # פקודות בסיס
     application.add_handler(CommandHandler("start", start_command))
@@ -320,8 +1044,30 @@ def main() -> None:
     # שגיאות
     application.add_error_handler(error_handler)
 
+    return application
+
+
+def main() -> None:
+    """
+    פונקציית ההרצה הראשית של הבוט.
+    BOT_MODE=webhook מריץ שרת ASGI (uvicorn), אחרת polling.
+    """
+    logger.info("Bot starting. API_BASE=%s BOT_MODE=%s", API_BASE, BOT_MODE)
+
+    application = build_application()
+
     # הרצה
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        import uvicorn
+
+        uvicorn.run(
+            build_webhook_app(application),
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            log_level="info",
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# ==== הגדרות ====
+# dispatcher קטן מול N מופעי בוט (bot.py עם BOT_MODE=webhook).
+# טלגרם שולח את כל העדכונים לכאן, וכל עדכון מועבר למופע שנקבע לפי
+# hash של ה-telegram_id  כך שמשתמש תמיד מגיע לאותו מופע, וה-user_data
+# שלו (last_order_id, referral_code) נשאר בזיכרון של המופע הזה.
+#
+# BOT_REPLICA_URLS=http://bot-0:8080,http://bot-1:8080
+# המופע ה-i ברשימה רץ עם BOT_REPLICA_INDEX=i ו-BOT_REPLICA_COUNT=<אורך הרשימה>.
+BOT_REPLICA_URLS: List[str] = [
+    u.strip().rstrip("/") for u in os.getenv("BOT_REPLICA_URLS", "").split(",") if u.strip()
+]
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+DISPATCH_HOST = os.getenv("DISPATCH_HOST", "0.0.0.0")
+DISPATCH_PORT = int(os.getenv("PORT", "8080"))
+DISPATCH_TIMEOUT = float(os.getenv("DISPATCH_TIMEOUT", "5"))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+)
+logger = logging.getLogger("slh_bot_dispatcher")
+
+
+# ==== ניתוב ====
+
+def shard_for(key: int | None, count: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): מספר מופע יציב לכל משתמש.
+    כשמוסיפים מופע, רק ~1/N מהמשתמשים עוברים למופע אחר.
+    עדכונים בלי משתמש הולכים למופע 0.
+    """
+    if key is None or count <= 1:
+        return 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < count:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def update_user_id(data: Dict[str, Any]) -> int | None:
+    """
+    מזהה המשתמש מתוך ה-JSON הגולמי של העדכון, באותו סדר כמו
+    update_user_key בבוט: קודם המשתמש (from/user), אחרת הצ'אט.
+    """
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            user = value.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+class Dispatcher:
+    """
+    מעביר כל עדכון למופע שלו. העברות של אותו משתמש רצות אחת אחרי השנייה,
+    כדי שגם כשטלגרם שולח כמה בקשות במקביל הסדר שלהן אצל המופע יישמר.
+    """
+
+    def __init__(self, replica_urls: List[str]):
+        if not replica_urls:
+            raise RuntimeError("BOT_REPLICA_URLS is empty")
+        self.replica_urls = replica_urls
+        self.client: httpx.AsyncClient | None = None
+        # user_id -> [lock, מספר העברות שממתינות/רצות]
+        self._locks: Dict[int, list] = {}
+        self.forwarded = [0] * len(replica_urls)
+        self.failed = [0] * len(replica_urls)
+
+    async def start(self) -> None:
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DISPATCH_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=len(self.replica_urls) * 8),
+        )
+
+    async def stop(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def forward(self, body: bytes, user_id: int | None) -> int:
+        """
+        מחזיר את סטטוס התשובה של המופע (502 אם הוא לא זמין  טלגרם ינסה שוב).
+        """
+        if user_id is None:
+            return await self._send(0, body)
+
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._send(shard_for(user_id, len(self.replica_urls)), body)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    async def _send(self, index: int, body: bytes) -> int:
+        headers = {"Content-Type": "application/json"}
+        if WEBHOOK_SECRET:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = WEBHOOK_SECRET
+        try:
+            resp = await self.client.post(
+                self.replica_urls[index] + WEBHOOK_PATH,
+                content=body,
+                headers=headers,
+            )
+        except httpx.HTTPError:
+            logger.exception("Replica %s unreachable", index)
+            self.failed[index] += 1
+            return 502
+        if resp.status_code >= 300:
+            self.failed[index] += 1
+            return 502
+        self.forwarded[index] += 1
+        return 200
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replicas": [
+                {"url": url, "forwarded": self.forwarded[i], "failed": self.failed[i]}
+                for i, url in enumerate(self.replica_urls)
+            ],
+        }
+
+
+async def register_webhook() -> None:
+    """
+    רק ה-dispatcher רושם webhook מול טלגרם (המופעים לא).
+    """
+    if not (BOT_TOKEN and WEBHOOK_URL):
+        logger.warning("BOT_TOKEN/WEBHOOK_URL not set, assuming the webhook is registered externally")
+        return
+    payload = {
+        "url": WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+    }
+    if WEBHOOK_SECRET:
+        payload["secret_token"] = WEBHOOK_SECRET
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        resp = await client.post(f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook", json=payload)
+        resp.raise_for_status()
+    logger.info("Webhook set: %s", payload["url"])
+
+
+def build_dispatcher_app(replica_urls: List[str] = BOT_REPLICA_URLS) -> Starlette:
+    dispatcher = Dispatcher(replica_urls)
+
+    async def telegram_webhook(request: Request) -> Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return Response(status_code=403)
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return Response(status_code=400)
+        # עדכון של טלגרם הוא תמיד אובייקט JSON
+        if not isinstance(data, dict):
+            return Response(status_code=400)
+        status = await dispatcher.forward(body, update_user_id(data))
+        return Response(status_code=status)
+
+    async def healthz(request: Request) -> Response:
+        return JSONResponse({"status": "ok", **dispatcher.stats()})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await dispatcher.start()
+        await register_webhook()
+        try:
+            yield
+        finally:
+            await dispatcher.stop()
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]),
+            Route("/healthz", healthz, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    logger.info("Dispatcher starting, %s replica(s)", len(BOT_REPLICA_URLS))
+    uvicorn.run(build_dispatcher_app(), host=DISPATCH_HOST, port=DISPATCH_PORT, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
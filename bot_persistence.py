@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import create_engine, event, text
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger("slh_bot_persistence")
+
+# ==== persistence לבוט ====
+# user_data / chat_data (last_order_id, referral_code...) נשמרים בטבלה אחת,
+# בקובץ SQLite או ב-Postgres (BOT_PERSISTENCE_URL), ושורדים restart/deploy.
+#
+# - קריאה מה-DB רק פעם אחת ב-startup; אחר כך הכל בזיכרון של ה-Application.
+# - הקצב נקבע רק ע"י update_interval של PTB: כל update_interval שניות
+#   ה-Application קורא ל-update_*_data עבור כל מה שהשתנה; העדכונים רק
+#   מסמנים רשומות כ"מלוכלכות", וכולן נכתבות מיד אחרי זה בטרנזקציה אחת
+#   (בלי השהיה נוספת משלנו).
+# - רשומה שלא השתנתה מאז הכתיבה האחרונה לא נכתבת שוב.
+# bot_data לא נשמר (מחזיק את ה-httpx client).
+
+UPSERT_SQL = (
+    "INSERT INTO {table} (kind, key, data, updated_at) VALUES (:kind, :key, :data, :at) "
+    "ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at"
+)
+DELETE_SQL = "DELETE FROM {table} WHERE kind = :kind AND key = :key"
+
+
+class SQLPersistence(BasePersistence):
+    def __init__(
+        self,
+        url: str,
+        table: str = "bot_state",
+        update_interval: float = 5.0,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.table = table
+        self.engine = create_engine(url, pool_pre_ping=True)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _sqlite_pragmas)
+
+        # (kind, key) -> JSON שנכתב לאחרונה / שממתין לכתיבה (None = מחיקה)
+        self._written: Dict[Tuple[str, str], str] = {}
+        self._dirty: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+
+    # ---- טעינה (פעם אחת ב-initialize) ----
+
+    def _load_kind(self, kind: str) -> Dict[str, Any]:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    "kind VARCHAR(64) NOT NULL, "
+                    "key VARCHAR(255) NOT NULL, "
+                    "data TEXT NOT NULL, "
+                    "updated_at TIMESTAMP NOT NULL, "
+                    "PRIMARY KEY (kind, key))"
+                )
+            )
+            rows = conn.execute(
+                text(f"SELECT key, data FROM {self.table} WHERE kind = :kind"),
+                {"kind": kind},
+            ).all()
+        result = {}
+        for key, data in rows:
+            self._written[(kind, key)] = data
+            result[key] = json.loads(data)
+        return result
+
+    async def _load(self, kind: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._load_kind, kind)
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(k): v for k, v in (await self._load("user")).items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(k): v for k, v in (await self._load("chat")).items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        data = await self._load(f"conversation:{name}")
+        return {tuple(json.loads(k)): v for k, v in data.items()}
+
+    # ---- עדכונים ----
+
+    def _mark(self, kind: str, key: Any, data: Any) -> None:
+        entry = (kind, str(key))
+        if data is None:
+            self._dirty[entry] = None
+        else:
+            payload = json.dumps(data, sort_keys=True, default=str)
+            current = self._dirty[entry] if entry in self._dirty else self._written.get(entry)
+            if payload == current:
+                self.rows_skipped += 1
+                return
+            self._dirty[entry] = payload
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._mark("user", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._mark("chat", chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        self._mark(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark("user", user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark("chat", chat_id, None)
+
+    # הנתונים כבר בזיכרון של ה-Application  אין קריאה ל-DB לכל עדכון
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    # ---- כתיבה ----
+
+    def _schedule_flush(self) -> None:
+        # ה-Application מריץ את כל ה-update_*_data של סבב ב-gather אחד; המשימה
+        # רצה אחריהם, כך שכל הסבב נכתב ב-batch אחד
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_now())
+
+    async def _flush_now(self) -> None:
+        while True:
+            try:
+                await self._write_dirty()
+                return
+            except Exception:
+                logger.exception(
+                    "Persistence flush failed, will retry in %ss", self.update_interval
+                )
+                await asyncio.sleep(self.update_interval)
+
+    def _write_batch(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        now = datetime.utcnow()
+        upserts = [
+            {"kind": kind, "key": key, "data": data, "at": now}
+            for (kind, key), data in batch.items()
+            if data is not None
+        ]
+        deletes = [
+            {"kind": kind, "key": key}
+            for (kind, key), data in batch.items()
+            if data is None
+        ]
+        with self.engine.begin() as conn:
+            if upserts:
+                conn.execute(text(UPSERT_SQL.format(table=self.table)), upserts)
+            if deletes:
+                conn.execute(text(DELETE_SQL.format(table=self.table)), deletes)
+
+    async def _write_dirty(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except BaseException:
+                # מחזירים לתור מה שלא נדרס בינתיים (גם בביטול ע"י flush)
+                for entry, data in batch.items():
+                    self._dirty.setdefault(entry, data)
+                raise
+            for entry, data in batch.items():
+                if data is None:
+                    self._written.pop(entry, None)
+                else:
+                    self._written[entry] = data
+            self.batches += 1
+            self.rows_written += len(batch)
+            logger.debug("Persisted %s row(s) in one batch", len(batch))
+
+    async def flush(self) -> None:
+        """
+        נקרא ב-Application.stop: כותב את כל מה שנשאר (גם מה שממתין לניסיון
+        חוזר).
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self._write_dirty()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_skipped": self.rows_skipped,
+            "pending": len(self._dirty),
+        }
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict
+
+import httpx
+
+logger = logging.getLogger("slh_bot_resilience")
+
+# ==== עמידות מול ה-API ====
+# - circuit breaker: אחרי failure_threshold כשלים רצופים (שגיאת רשת / 5xx)
+#   כל קריאה נכשלת מיד (CircuitOpen) במשך reset_timeout שניות, ואז קריאת
+#   ניסיון אחת בודקת אם ה-API חזר.
+# - retries עם jittered backoff, רק לקריאות idempotent (GET או עם Idempotency-Key).
+
+
+class CircuitOpen(Exception):
+    """
+    ה-API מסומן כלא זמין  הקריאה לא נשלחה בכלל.
+    """
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def before_call(self) -> None:
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.short_circuited += 1
+        raise CircuitOpen("API circuit is open")
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("API circuit closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    "API circuit opened after %s failure(s)", self.consecutive_failures
+                )
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        הקריאה בוטלה באמצע (למשל כיבוי)  משחררים את קריאת הניסיון בלי לקבוע מצב.
+        """
+        self._probe_in_flight = False
+
+    @property
+    def allows_calls(self) -> bool:
+        return self.state == self.CLOSED or (
+            self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class ResilientCaller:
+    """
+    עוטף קריאות httpx מול ה-API ב-breaker וב-retries.
+    מחזיר את ה-Response (גם 4xx/5xx אחרי הניסיון האחרון), כמו client.request.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+    ):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": מפזר את הניסיונות החוזרים של כל המשתמשים
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        url: str,
+        idempotent: bool,
+        reserved: bool = False,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        reserved=True: הקורא כבר קרא ל-breaker.before_call() לניסיון הראשון
+        (למשל כדי להיכשל מהר לפני עבודה יקרה שקודמת לקריאה).
+        """
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            if not (reserved and attempt == 0):
+                self.breaker.before_call()
+            self.calls += 1
+            last_attempt = attempt == attempts - 1
+            try:
+                resp = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                self.failures += 1
+                self.breaker.record_failure()
+                if last_attempt:
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                if resp.status_code < 500:
+                    self.breaker.record_success()
+                    return resp
+                self.failures += 1
+                self.breaker.record_failure()
+                if last_attempt:
+                    return resp
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+def is_api_unavailable(exc: BaseException) -> bool:
+    """
+    שגיאה שנובעת מכך שה-API לא זמין (ולא מבקשה שגויה)  שווה לנסות שוב אחר כך.
+    """
+    if isinstance(exc, (CircuitOpen, httpx.TransportError)):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code >= 500
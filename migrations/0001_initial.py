@@ -0,0 +1,87 @@
+"""
+Base schema: users, shops, items, orders as they were before the migration
+runner existed. Frozen here on purpose (not api.models), so this migration
+means the same thing no matter how the models change later; every later
+column or index is its own migration.
+
+create_all skips tables that already exist, so this is a no-op on
+databases created before the migration runner.
+"""
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    MetaData,
+    String,
+    Table,
+    Text,
+)
+
+metadata = MetaData()
+
+Table(
+    "users",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("telegram_id", BigInteger, unique=True, index=True, nullable=False),
+    Column("telegram_username", String, nullable=True),
+    Column("display_name", String, nullable=True),
+    Column("bnb_address", String, nullable=True),
+    Column("ton_address", String, nullable=True),
+    Column("referrer_id", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+Table(
+    "shops",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("owner_user_id", String, ForeignKey("users.id"), nullable=False),
+    Column("title", String, nullable=False),
+    Column("description", Text, nullable=True),
+    Column("slug", String, unique=True, index=True, nullable=False),
+    Column("shop_type", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("referral_code", String, unique=True, index=True, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+Table(
+    "items",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("shop_id", String, ForeignKey("shops.id"), nullable=False),
+    Column("name", String, nullable=False),
+    Column("description", Text, nullable=True),
+    Column("image_url", String, nullable=True),
+    Column("price_slh", String, nullable=True),
+    Column("price_bnb", String, nullable=True),
+    Column("price_nis", Float, nullable=True),
+    Column("metadata_json", Text, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+Table(
+    "orders",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("buyer_user_id", String, ForeignKey("users.id"), nullable=False),
+    Column("shop_id", String, ForeignKey("shops.id"), nullable=False),
+    Column("item_id", String, ForeignKey("items.id"), nullable=False),
+    Column("amount_slh", String, nullable=True),
+    Column("amount_bnb", String, nullable=True),
+    Column("status", String, nullable=False),
+    Column("tx_hash", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(bind=conn)
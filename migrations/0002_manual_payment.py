@@ -0,0 +1,13 @@
+"""
+orders.payment_proof_url: where the uploaded payment proof is stored.
+Checks the existing columns instead of relying on ADD COLUMN IF NOT EXISTS,
+so it runs on SQLite as well as Postgres.
+"""
+
+from sqlalchemy import inspect
+
+
+def upgrade(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("orders")}
+    if "payment_proof_url" not in columns:
+        conn.exec_driver_sql("ALTER TABLE orders ADD COLUMN payment_proof_url TEXT")
@@ -0,0 +1,22 @@
+"""
+Composite indexes for the hot filters + keyset pagination order
+(created_at, id). On Postgres they are built CONCURRENTLY so writes to the
+tables are not blocked while the index builds.
+"""
+
+TRANSACTIONAL = False
+
+INDEXES = [
+    ("ix_orders_buyer_created", "orders", "buyer_user_id, created_at, id"),
+    ("ix_orders_shop_created", "orders", "shop_id, created_at, id"),
+    ("ix_items_shop_created", "items", "shop_id, created_at, id"),
+    ("ix_shops_owner_created", "shops", "owner_user_id, created_at, id"),
+]
+
+
+def upgrade(conn):
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    for name, table, columns in INDEXES:
+        conn.exec_driver_sql(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+        )
@@ -0,0 +1,14 @@
+"""
+orders.payment_proof_file_unique_id: Telegram file_unique_id of the uploaded
+payment proof, so a resent receipt can be recognised without downloading it.
+"""
+
+from sqlalchemy import inspect
+
+
+def upgrade(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("orders")}
+    if "payment_proof_file_unique_id" not in columns:
+        conn.exec_driver_sql(
+            "ALTER TABLE orders ADD COLUMN payment_proof_file_unique_id VARCHAR"
+        )
@@ -0,0 +1,25 @@
+"""
+idempotency_keys: responses of writes sent with an Idempotency-Key, shared
+by every worker and API replica (api/idempotency.py). One row per
+(scope, key); status_code is NULL while the first request is running.
+"""
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "idempotency_keys",
+    metadata,
+    Column("scope", String(64), primary_key=True),
+    Column("key", String(255), primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("status_code", Integer, nullable=True),
+    Column("body", LargeBinary, nullable=True),
+    Column("media_type", String(255), nullable=True),
+    Column("expires_at", DateTime, nullable=False, index=True),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(bind=conn)
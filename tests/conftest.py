@@ -0,0 +1,134 @@
+import importlib
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DB_MODES = ("async", "sync")
+
+_seq = itertools.count(1)
+
+
+class StatementLog:
+    """
+    Every statement the engine sends to the database, in order.
+    """
+
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def clear(self) -> None:
+        self.statements.clear()
+
+    def selects(self):
+        return [s for s in self.statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def _import_app():
+    # DB_MODE and the engines are fixed when api.db is imported, so every
+    # mode gets a fresh import of the package
+    for name in [m for m in sys.modules if m == "api" or m.startswith("api.")]:
+        del sys.modules[name]
+    return (
+        importlib.import_module("api.main"),
+        importlib.import_module("api.db"),
+        importlib.import_module("api.models"),
+    )
+
+
+@pytest.fixture(scope="module", params=DB_MODES)
+def api(request, tmp_path_factory):
+    """
+    The API on a fresh SQLite file, in each DB_MODE.
+    SQLITE_PROFILE is off so reads and writes share one engine.
+    """
+    tmp = tmp_path_factory.mktemp(f"api-{request.param}")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("DB_MODE", request.param)
+        mp.setenv("DATABASE_URL", f"sqlite:///{tmp / 'shop.db'}")
+        mp.delenv("ASYNC_DATABASE_URL", raising=False)
+        mp.delenv("DATABASE_READ_URLS", raising=False)
+        mp.setenv("SQLITE_PROFILE", "0")
+        mp.setenv("ORDER_BATCH", "0")
+        mp.setenv("PROOF_STORAGE", "local")
+        mp.setenv("PROOF_STORAGE_DIR", str(tmp / "proofs"))
+        main, db, models = _import_app()
+
+        engine = db.async_engine.sync_engine if db.async_engine is not None else db.engine
+        # fixtures write their rows through a separate engine, so they
+        # don't show up in the statement log
+        seed_engine = create_engine(db.DATABASE_URL)
+        with TestClient(main.app) as client:
+            yield SimpleNamespace(
+                client=client,
+                statements=StatementLog(engine),
+                models=models,
+                seed_engine=seed_engine,
+                mode=request.param,
+            )
+        seed_engine.dispose()
+
+
+def _seed(api, **rows):
+    """
+    Inserts a user, a shop owned by them and an item of that shop.
+    Column overrides go in rows={"user": {...}, "shop": {...}, "item": {...}}.
+    Returns their ids.
+    """
+    n = next(_seq)
+    m = api.models
+    with Session(api.seed_engine) as session:
+        user = m.User(telegram_id=n, display_name=f"user {n}", **rows.get("user", {}))
+        session.add(user)
+        session.flush()
+        shop = m.Shop(
+            owner_user_id=user.id,
+            title=f"Shop {n}",
+            slug=f"shop-{n}",
+            shop_type="basic",
+            referral_code=f"ref{n}",
+            **rows.get("shop", {}),
+        )
+        session.add(shop)
+        session.flush()
+        item = m.Item(
+            shop_id=shop.id,
+            name=f"Item {n}",
+            price_slh="12.5",
+            image_url="https://example.com/i.png",
+            **rows.get("item", {}),
+        )
+        session.add(item)
+        session.commit()
+        return SimpleNamespace(user_id=user.id, shop_id=shop.id, item_id=item.id)
+
+
+@pytest.fixture
+def seed(api):
+    """
+    seed(**rows) -> ids of a new user, shop and item (see _seed).
+    """
+    return lambda **rows: _seed(api, **rows)
+
+
+@pytest.fixture
+def shop(seed):
+    """
+    A buyer, a shop with one SLH-priced item, and the order payload for them.
+    """
+    ids = seed()
+    ids.order = {"buyer_user_id": ids.user_id, "shop_id": ids.shop_id, "item_id": ids.item_id}
+    return ids
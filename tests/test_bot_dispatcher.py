@@ -0,0 +1,25 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import bot_dispatcher
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(bot_dispatcher, "WEBHOOK_SECRET", "")
+    # no lifespan: nothing here may reach a replica
+    return TestClient(bot_dispatcher.build_dispatcher_app(["http://replica.invalid"]))
+
+
+@pytest.mark.parametrize("body", [b"not json", b"[]", b"1", b'"update"', b"null"])
+def test_webhook_rejects_a_body_that_is_not_an_update(client, body):
+    r = client.post(bot_dispatcher.WEBHOOK_PATH, content=body)
+
+    assert r.status_code == 400
+
+
+def test_update_user_id_prefers_the_sender_over_the_chat():
+    update = {"update_id": 1, "message": {"from": {"id": 5}, "chat": {"id": -10}}}
+
+    assert bot_dispatcher.update_user_id(update) == 5
+    assert bot_dispatcher.update_user_id({"update_id": 1, "poll": {"id": "x"}}) is None
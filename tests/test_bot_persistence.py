@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from bot_persistence import SQLPersistence
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    # an update_interval this long would show up as a hang if writes still waited for it
+    persistence = SQLPersistence(f"sqlite:///{tmp_path / 'bot.db'}", update_interval=3600)
+    yield persistence
+    persistence.engine.dispose()
+
+
+def stored(persistence):
+    with persistence.engine.connect() as conn:
+        rows = conn.execute(text("SELECT kind, key, data FROM bot_state ORDER BY kind, key")).all()
+    return [tuple(row) for row in rows]
+
+
+async def update_round(persistence, **users):
+    # what Application.update_persistence does every update_interval
+    await asyncio.gather(*(persistence.update_user_data(int(k[1:]), v) for k, v in users.items()))
+
+
+def test_a_round_is_written_at_once_in_one_batch(persistence):
+    async def main():
+        await persistence.get_user_data()
+        await update_round(persistence, u1={"a": 1}, u2={"b": 2})
+        await asyncio.wait_for(persistence._flusher, 5)
+
+    asyncio.run(main())
+    assert stored(persistence) == [("user", "1", '{"a": 1}'), ("user", "2", '{"b": 2}')]
+    assert persistence.stats()["batches"] == 1
+
+
+def test_unchanged_data_is_not_written_again(persistence):
+    async def main():
+        await persistence.get_user_data()
+        await update_round(persistence, u1={"a": 1})
+        await asyncio.wait_for(persistence._flusher, 5)
+        await update_round(persistence, u1={"a": 1})
+        await persistence.flush()
+
+    asyncio.run(main())
+    assert persistence.stats() == {"batches": 1, "rows_written": 1, "rows_skipped": 1, "pending": 0}
+
+
+def test_flush_writes_what_is_pending(persistence):
+    async def main():
+        await persistence.get_user_data()
+        await persistence.update_user_data(1, {"a": 1})
+        await persistence.drop_chat_data(7)
+        await persistence.flush()
+
+    asyncio.run(main())
+    assert stored(persistence) == [("user", "1", '{"a": 1}')]
+    assert persistence.stats()["pending"] == 0
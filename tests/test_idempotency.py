@@ -0,0 +1,91 @@
+import importlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+
+def count(api, model, *where):
+    with Session(api.seed_engine) as session:
+        return session.scalar(select(func.count()).select_from(model).where(*where))
+
+
+def forget_in_memory():
+    # what another worker or API replica knows about the key: only the table
+    importlib.import_module("api.idempotency").idempotency_store._responses.clear()
+
+
+def test_retry_replays_the_order(api, shop):
+    Order = api.models.Order
+    headers = {"Idempotency-Key": f"tg-order-{shop.user_id}"}
+
+    first = api.client.post("/orders", json=shop.order, headers=headers)
+    forget_in_memory()
+    retry = api.client.post("/orders", json=shop.order, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert count(api, Order, Order.buyer_user_id == shop.user_id) == 1
+
+
+def test_key_reused_with_another_request(api, shop):
+    headers = {"Idempotency-Key": f"tg-reuse-{shop.user_id}"}
+    assert api.client.post("/orders", json=shop.order, headers=headers).status_code == 200
+    forget_in_memory()
+
+    r = api.client.post(
+        "/orders", json={**shop.order, "payment_method": "bnb"}, headers=headers
+    )
+    assert r.status_code == 422
+
+
+def test_failed_call_is_not_stored(api, shop):
+    Key = api.models.IdempotencyKey
+    headers = {"Idempotency-Key": f"tg-fail-{shop.user_id}"}
+    body = {**shop.order, "item_id": "missing"}
+
+    assert api.client.post("/orders", json=body, headers=headers).status_code == 400
+    assert count(api, Key, Key.key == headers["Idempotency-Key"]) == 0
+    # runs for real again
+    assert api.client.post("/orders", json=body, headers=headers).status_code == 400
+
+
+def test_expired_claim_is_taken_over(api, shop):
+    Key, Order = api.models.IdempotencyKey, api.models.Order
+    key = f"tg-stale-{shop.user_id}"
+    fp = importlib.import_module("api.idempotency").fingerprint
+    # a worker claimed the key and died before finishing
+    with Session(api.seed_engine) as session:
+        session.add(
+            Key(
+                scope="orders.create",
+                key=key,
+                fingerprint=fp("whatever"),
+                expires_at=datetime.utcnow() - timedelta(seconds=1),
+            )
+        )
+        session.commit()
+
+    r = api.client.post("/orders", json=shop.order, headers={"Idempotency-Key": key})
+
+    assert r.status_code == 200
+    assert count(api, Order, Order.buyer_user_id == shop.user_id) == 1
+    assert count(api, Key, Key.key == key, Key.status_code == 200) == 1
+
+
+def test_demo_order_bot_route_is_reachable(api, shop):
+    user = api.client.get(f"/users/{shop.user_id}").json()
+    headers = {"Idempotency-Key": f"tg-demo-{shop.user_id}"}
+
+    first = api.client.get(
+        "/shops/demo-order-bot", params={"telegram_id": user["telegram_id"]}, headers=headers
+    )
+    forget_in_memory()
+    retry = api.client.get(
+        "/shops/demo-order-bot", params={"telegram_id": user["telegram_id"]}, headers=headers
+    )
+
+    assert first.status_code == 200, first.text
+    assert first.json()["ok"] is True
+    assert retry.json()["order_id"] == first.json()["order_id"]
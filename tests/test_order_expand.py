@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy.orm import Session
+
+
+def add_orders(api, seed, buyer_user_id, count):
+    """
+    count orders for the buyer, each from a shop and item of its own,
+    so a per-row lookup of the relations would show up as extra queries.
+    """
+    m = api.models
+    sellers = [seed() for _ in range(count)]
+    with Session(api.seed_engine) as session:
+        session.add_all(
+            m.Order(
+                buyer_user_id=buyer_user_id,
+                shop_id=s.shop_id,
+                item_id=s.item_id,
+                amount_slh="12.5",
+            )
+            for s in sellers
+        )
+        session.commit()
+    return sellers
+
+
+@pytest.mark.parametrize("count", [1, 10, 50])
+def test_user_orders_expand_is_one_query(api, seed, count):
+    buyer = seed()
+    sellers = add_orders(api, seed, buyer.user_id, count)
+
+    api.statements.clear()
+    r = api.client.get(
+        f"/users/{buyer.user_id}/orders", params={"expand": "item,shop", "limit": 50}
+    )
+
+    assert r.status_code == 200, r.text
+    assert len(api.statements.statements) == 1, api.statements.statements
+
+    orders = r.json()["items"]
+    assert len(orders) == count
+    shops = {s.shop_id: s for s in sellers}
+    for order in orders:
+        seller = shops[order["shop"]["id"]]
+        assert order["item"]["id"] == seller.item_id
+        assert order["item"]["price_slh"] == "12.5"
+        assert order["shop"]["status"] == "active"
+
+
+@pytest.mark.parametrize("count", [1, 10, 50])
+def test_orders_lookup_expand_is_one_query(api, seed, count):
+    buyer = seed()
+    add_orders(api, seed, buyer.user_id, count)
+    page = api.client.get(f"/users/{buyer.user_id}/orders", params={"limit": 50}).json()
+    ids = [o["id"] for o in page["items"]]
+
+    api.statements.clear()
+    r = api.client.post("/orders:lookup", params={"expand": "item,shop"}, json={"ids": ids})
+
+    assert r.status_code == 200, r.text
+    assert len(api.statements.statements) == 1, api.statements.statements
+    assert sorted(r.json()["items"]) == sorted(ids)
+    assert all(o["item"] and o["shop"] for o in r.json()["items"].values())
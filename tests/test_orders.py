@@ -0,0 +1,50 @@
+import pytest
+
+
+def test_create_order_issues_two_statements(api, shop):
+    api.statements.clear()
+    r = api.client.post("/orders", json=shop.order)
+
+    assert r.status_code == 200, r.text
+    # one validation SELECT, one INSERT ... RETURNING
+    assert len(api.statements.statements) == 2, api.statements.statements
+    assert api.statements.statements[0].lstrip().upper().startswith("SELECT")
+    assert api.statements.statements[1].lstrip().upper().startswith("INSERT")
+
+    body = r.json()
+    assert body["order"]["status"] == "pending"
+    assert body["order"]["amount_slh"] == "12.5"
+    assert body["payment_instructions"]["amount"] == "12.5"
+
+
+def test_create_order_item_of_another_shop(api, shop, seed):
+    other = seed()
+    api.statements.clear()
+    r = api.client.post("/orders", json={**shop.order, "shop_id": other.shop_id})
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Item does not belong to shop"
+    # rejected on the validation query alone
+    assert len(api.statements.statements) == 1
+
+
+@pytest.mark.parametrize(
+    "field, detail",
+    [
+        ("buyer_user_id", "Buyer user not found"),
+        ("shop_id", "Shop not found"),
+        ("item_id", "Item not found"),
+    ],
+)
+def test_create_order_missing_row(api, shop, field, detail):
+    r = api.client.post("/orders", json={**shop.order, field: "missing"})
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == detail
+
+
+def test_create_order_without_price(api, shop):
+    r = api.client.post("/orders", json={**shop.order, "payment_method": "bnb"})
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Item has no BNB price"
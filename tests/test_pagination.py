@@ -0,0 +1,109 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+TIE = datetime(2025, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def buyer(api, seed):
+    """
+    A buyer with 7 orders: 5 created in the same instant (ordered by id
+    only) between one earlier and one later order.
+    """
+    shop = seed()
+    m = api.models
+    created = [TIE - timedelta(seconds=1)] + [TIE] * 5 + [TIE + timedelta(seconds=1)]
+    with Session(api.seed_engine) as session:
+        session.add_all(
+            m.Order(
+                buyer_user_id=shop.user_id,
+                shop_id=shop.shop_id,
+                item_id=shop.item_id,
+                amount_slh="1",
+                created_at=at,
+                updated_at=at,
+            )
+            for at in created
+        )
+        session.commit()
+    return shop.user_id
+
+
+def orders_url(user_id):
+    return f"/users/{user_id}/orders"
+
+
+def all_ids(api, user_id):
+    r = api.client.get(orders_url(user_id), params={"unpaginated": True})
+    return [o["id"] for o in r.json()["items"]]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 6])
+def test_cursor_round_trip_across_a_tie(api, buyer, limit):
+    expected = all_ids(api, buyer)
+    tied = expected[1:6]
+    assert tied == sorted(tied)  # ties are ordered by id
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        page = api.client.get(orders_url(buyer), params=params).json()
+        assert len(page["items"]) <= limit
+        seen += [o["id"] for o in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == -(-len(expected) // limit)
+
+
+def test_last_full_page_has_no_cursor(api, buyer):
+    page = api.client.get(orders_url(buyer), params={"limit": 7}).json()
+
+    assert len(page["items"]) == 7
+    assert page["next_cursor"] is None
+
+
+def b64(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not base64!", b64("no separator"), b64("not a date|abc"), "%%%", "a"],
+)
+def test_invalid_cursor(api, buyer, cursor):
+    r = api.client.get(orders_url(buyer), params={"cursor": cursor})
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize("limit, status", [(0, 422), (-1, 422), (1, 200), (500, 200), (501, 422)])
+def test_limit_bounds(api, buyer, limit, status):
+    assert api.client.get(orders_url(buyer), params={"limit": limit}).status_code == status
+
+
+def test_unpaginated_returns_every_row(api, seed):
+    shop = seed()
+    m = api.models
+    with Session(api.seed_engine) as session:
+        session.add_all(
+            m.Order(buyer_user_id=shop.user_id, shop_id=shop.shop_id, item_id=shop.item_id)
+            for _ in range(60)
+        )
+        session.commit()
+
+    default = api.client.get(orders_url(shop.user_id)).json()
+    everything = api.client.get(orders_url(shop.user_id), params={"unpaginated": True}).json()
+
+    assert len(default["items"]) == 50 and default["next_cursor"]
+    assert len(everything["items"]) == 60
+    assert everything["next_cursor"] is None
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import importlib
+
+import pytest
+
+
+class FakeSession:
+    def __init__(self, fail_close=False):
+        self.fail_close = fail_close
+        self.committed = False
+
+    @contextlib.asynccontextmanager
+    async def begin_nested(self):
+        yield
+
+    async def commit(self):
+        self.committed = True
+
+    async def close(self):
+        if self.fail_close:
+            raise RuntimeError("close failed")
+
+
+class Abort(BaseException):
+    pass
+
+
+@pytest.fixture
+def writer(api):
+    db = importlib.import_module("api.db")
+    writer = db.SQLiteWriter(max_batch=10)
+    sessions = []
+
+    def session():
+        if writer.broken:
+            writer.broken = False
+            raise RuntimeError("no connection")
+        sessions.append(FakeSession(fail_close=writer.fail_close))
+        return sessions[-1]
+
+    writer.broken = False
+    writer.fail_close = False
+    writer.sessions = sessions
+    writer._session = session
+    return writer
+
+
+async def ok(session):
+    return "ok"
+
+
+def submit(writer, fn):
+    # a dead writer never answers
+    return asyncio.wait_for(writer.submit(fn), 5)
+
+
+def test_writer_survives_a_session_that_cannot_open(writer):
+    async def main():
+        writer.broken = True
+        with pytest.raises(RuntimeError, match="no connection"):
+            await submit(writer, ok)
+        assert await submit(writer, ok) == "ok"
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_writer_survives_a_base_exception_from_a_write(writer):
+    async def abort(session):
+        raise Abort()
+
+    async def main():
+        results = await asyncio.gather(submit(writer, ok), submit(writer, abort), return_exceptions=True)
+        # nothing of the batch was committed, so all of it fails
+        assert [type(r) for r in results] == [Abort, Abort]
+        assert await submit(writer, ok) == "ok"
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_a_failed_close_keeps_the_committed_results(writer):
+    writer.fail_close = True
+
+    async def main():
+        assert await asyncio.gather(submit(writer, ok), submit(writer, ok)) == ["ok", "ok"]
+        await writer.close()
+
+    asyncio.run(main())
+    assert writer.sessions[0].committed
@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def user(api, seed):
+    return api.client.get(f"/users/{seed().user_id}").json()
+
+
+def test_new_user_is_one_statement(api):
+    api.statements.clear()
+    r = api.client.post("/users/telegram-sync", json={"telegram_id": 900_000, "display_name": "new"})
+
+    assert r.status_code == 200, r.text
+    assert r.json()["display_name"] == "new"
+    # INSERT ... ON CONFLICT ... RETURNING
+    assert len(api.statements.statements) == 1, api.statements.statements
+
+
+def test_unchanged_profile_writes_nothing(api, user):
+    api.statements.clear()
+    r = api.client.post(
+        "/users/telegram-sync",
+        json={"telegram_id": user["telegram_id"], "display_name": user["display_name"]},
+    )
+
+    assert r.status_code == 200, r.text
+    # the upsert's WHERE matches nothing, then the stored row is read back
+    statements = api.statements.statements
+    assert len(statements) == 2, statements
+    assert statements[0].lstrip().upper().startswith("INSERT")
+    assert statements[1].lstrip().upper().startswith("SELECT")
+    assert r.json()["updated_at"] == user["updated_at"]
+    assert api.client.get(f"/users/{user['id']}").json() == user
+
+
+def test_empty_fields_keep_the_stored_profile(api, user):
+    r = api.client.post(
+        "/users/telegram-sync",
+        json={"telegram_id": user["telegram_id"], "display_name": "", "telegram_username": ""},
+    )
+
+    assert r.json()["display_name"] == user["display_name"]
+    assert r.json()["updated_at"] == user["updated_at"]
+
+
+def test_changed_profile_is_one_upsert(api, user):
+    api.statements.clear()
+    r = api.client.post(
+        "/users/telegram-sync",
+        json={"telegram_id": user["telegram_id"], "telegram_username": "renamed"},
+    )
+
+    assert r.status_code == 200, r.text
+    assert len(api.statements.statements) == 1, api.statements.statements
+    assert r.json()["id"] == user["id"]
+    assert r.json()["telegram_username"] == "renamed"
+    assert r.json()["display_name"] == user["display_name"]
+    assert r.json()["updated_at"] != user["updated_at"]
@@ -0,0 +1,141 @@
+import importlib
+import os
+
+import pytest
+
+BOUNDARY = "testboundary"
+
+
+def stored_files():
+    root = importlib.import_module("api.proof_storage").proof_storage.root
+    return sorted(
+        os.path.join(d, f) for d, _, files in os.walk(root) for f in files
+    )
+
+
+def stored_bytes(proof_url):
+    proofs = importlib.import_module("api.proof_storage")
+    key = proof_url[len(proofs.PROOF_URL_PREFIX) + 1:]
+    return (proofs.proof_storage.root / key).read_bytes()
+
+
+def multipart(parts, chunk_size=None):
+    """
+    Body with the parts in the given order: ("field", name, value) or
+    ("file", name, data). With chunk_size it is sent in chunks (no
+    Content-Length), the way a streaming client sends it.
+    """
+    body = b""
+    for kind, name, value in parts:
+        if kind == "file":
+            body += (
+                f"--{BOUNDARY}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="proof.png"\r\n'
+                "Content-Type: image/png\r\n\r\n"
+            ).encode() + value + b"\r\n"
+        else:
+            body += (
+                f"--{BOUNDARY}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode()
+    body += f"--{BOUNDARY}--\r\n".encode()
+    if chunk_size is None:
+        return body
+    return (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+
+def upload(api, parts, chunk_size=None, params=None):
+    return api.client.post(
+        "/payments/upload-proof",
+        params=params,
+        content=multipart(parts, chunk_size),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+
+
+@pytest.fixture
+def order_id(api, shop):
+    return api.client.post("/orders", json=shop.order).json()["order"]["id"]
+
+
+@pytest.mark.parametrize("file_first", [False, True])
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+def test_part_order_does_not_matter(api, order_id, file_first, chunk_size):
+    data = os.urandom(200_000)
+    fields = [("field", "order_id", order_id), ("field", "file_unique_id", f"u-{order_id}")]
+    parts = [("file", "file", data), *fields] if file_first else [*fields, ("file", "file", data)]
+
+    r = upload(api, parts, chunk_size)
+
+    assert r.status_code == 200, r.text
+    assert r.json()["duplicate"] is False
+    order = api.client.get(f"/orders/{order_id}").json()
+    assert order["status"] == "waiting_verification"
+    assert stored_bytes(r.json()["proof_url"]) == data
+
+    # same Telegram photo again
+    assert upload(api, parts, chunk_size).json()["duplicate"] is True
+
+
+def test_order_id_in_query(api, order_id):
+    r = upload(api, [("file", "file", b"png")], params={"order_id": order_id})
+
+    assert r.status_code == 200, r.text
+    assert r.json()["order_id"] == order_id
+
+
+def test_missing_order_in_query_is_rejected_before_the_body(api):
+    sent = []
+
+    def body():
+        for chunk in multipart([("file", "file", b"x" * 100_000)], chunk_size=1024):
+            sent.append(chunk)
+            yield chunk
+
+    r = api.client.post(
+        "/payments/upload-proof",
+        params={"order_id": "missing"},
+        content=body(),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+
+    assert r.status_code == 404
+    assert len(sent) <= 1
+
+
+@pytest.mark.parametrize("file_first", [False, True])
+def test_missing_order_stores_nothing(api, file_first):
+    before = stored_files()
+    parts = [("field", "order_id", "missing"), ("file", "file", b"y" * 10_000)]
+    if file_first:
+        parts.reverse()
+
+    assert upload(api, parts, chunk_size=1024).status_code == 404
+    assert stored_files() == before
+
+
+def test_order_id_is_required(api):
+    r = upload(api, [("file", "file", b"png")])
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == "order_id is required"
+
+
+def test_too_large(api, order_id, monkeypatch):
+    monkeypatch.setattr(importlib.import_module("api.proof_storage"), "PROOF_MAX_BYTES", 1000)
+    r = upload(api, [("file", "file", b"z" * 5000), ("field", "order_id", order_id)], chunk_size=512)
+
+    assert r.status_code == 413
+
+
+def test_uploads_are_staged_outside_the_served_root(api, order_id):
+    storage = importlib.import_module("api.proof_storage").proof_storage
+    staged_dir = os.path.realpath(storage.tmp_dir)
+    assert not staged_dir.startswith(os.path.realpath(storage.root) + os.sep)
+
+    r = upload(api, [("file", "file", b"abc")], params={"order_id": order_id})
+
+    assert r.status_code == 200
+    assert api.client.get(r.json()["proof_url"]).content == b"abc"
+    assert os.listdir(staged_dir) == []